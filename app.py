@@ -1,11 +1,23 @@
+import importlib
 import os
-import json
-import re
-import requests
-from bs4 import BeautifulSoup
-import yfinance as yf
-from flask import Flask, render_template, request, jsonify
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from flask import Flask, Response, render_template, request, jsonify
 from flask_cors import CORS
+from backend.services.cache import ResponseCache
+from backend.services.favorites import FavoritesRepository
+from backend.services.flask_support import (
+    CODE_PREFIX_RE, CODE_RE, UpstreamFetcher, install_request_metrics, shared_loader, warm_templates,
+    watchlist_blueprint,
+)
+from backend.services.history_store import HistoryStore
+from backend.services.market_calendar import MarketCalendar
+from backend.services.metrics import PipelineMetrics
+from backend.services.name_resolver import NameResolver
+from backend.services.parsing import NEWS_SCOPE, make_detail_soup, make_soup
+from backend.services.scheduler import UpstreamScheduler
+from backend.services.shared_store import SharedTier, open_shared_store
 
 app = Flask(__name__)
 CORS(app)
@@ -16,132 +28,230 @@ def test():
 
 FAVORITES_FILE = "favorites.json"
 
+# 株探の URL (負荷試験ではローカルのスタブサーバーに向ける)
+KABUTAN_BASE_URL = os.environ.get("KABUTAN_BASE_URL", "https://kabutan.jp")
+
+# ウォッチリストはメモリに保持し、ファイルが更新された時だけ読み直す。書き込みはまとめて原子的に行う
+favorites = FavoritesRepository(FAVORITES_FILE, default={"6752": "パナソニック", "9434": "ソフトバンク"})
+
+# 東証の取引カレンダー。MARKET_HOLIDAYS は祝日以外の臨時休場日 (YYYY-MM-DD のカンマ区切り)
+market_calendar = MarketCalendar(os.environ.get("MARKET_HOLIDAYS", "").split(","))
+
+# 株探スクレイピング結果のキャッシュ (秒)。期限切れ後も CACHE_MAX_STALE 秒は古い値を返しつつ裏で再取得する
+# 取引時間外の株価は次の寄り付きまで変わらないので、その間は TTL を延ばす
+scrape_cache = ResponseCache(
+    ttls={
+        "quote": float(os.environ.get("CACHE_TTL_QUOTE", 15)),
+        "news": float(os.environ.get("CACHE_TTL_NEWS", 120)),
+        "chart": float(os.environ.get("CACHE_TTL_CHART", 300)),
+    },
+    max_stale=float(os.environ.get("CACHE_MAX_STALE", 300)),
+    max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", 2048)),
+    ttl_policy=market_calendar.ttl,
+)
+
+# 日足のローカル蓄積 (SQLite)。OHLCV_STORE_PATH を空にすると毎回 yfinance から取得する
+OHLCV_STORE_PATH = os.environ.get("OHLCV_STORE_PATH", "data/ohlcv.sqlite3")
+OHLCV_SYNC_INTERVAL = float(os.environ.get("OHLCV_SYNC_INTERVAL", 900))
+history_store = HistoryStore(OHLCV_STORE_PATH) if OHLCV_STORE_PATH else None
+# 保存するのは yfinance 既定の調整済み株価。分割・配当で過去分が調整し直されたら、同期時に検出して全期間を取り直す
+OHLCV_SOURCE = "yfinance"
+
+# gunicorn の複数ワーカーで共有するキャッシュ・プロセス間ロック・レート制御
+# SHARED_STORE_URL に SQLite のパス (同一ホスト) か redis://... を指定すると有効 (空なら共有しない)
+shared_store = open_shared_store(os.environ.get("SHARED_STORE_URL", ""))
+shared_tier = SharedTier(shared_store, namespace="tradeinfo-flask") if shared_store else None
+_shared_load = shared_loader(shared_tier, scrape_cache)
+
+# 株探へのアクセスはすべてスケジューラーを通す (トークンバケット + 優先レーン + 429/5xx バックオフ)
+upstream_scheduler = UpstreamScheduler(
+    rate=float(os.environ.get("UPSTREAM_RATE", 5)),
+    burst=float(os.environ.get("UPSTREAM_BURST", 10)),
+    host_rate=float(os.environ.get("UPSTREAM_HOST_RATE", 3)),
+    host_burst=float(os.environ.get("UPSTREAM_HOST_BURST", 6)),
+    slow_threshold=float(os.environ.get("UPSTREAM_SLOW_THRESHOLD", 3)),
+    shared=shared_store,
+)
+
+# 株探への接続は keep-alive のセッションで使い回す。詳細はリクエストのスレッド、ニュースは FETCH_WORKERS のスレッドで並行取得する
+# SERVER_THREADS はリクエストを処理するスレッド数 (gunicorn の --threads と同じ値にする)
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", 8))
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", 8))
+NAME_RESOLVE_WORKERS = int(os.environ.get("NAME_RESOLVE_WORKERS", 8))
+fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="upstream")
+
+# 銘柄名の解決: 銘柄マスター CSV (STOCK_MASTER_FILE: コード,銘柄名) → キャッシュ → 株探 (NAME_RESOLVE_WORKERS 並列)
+name_resolver = NameResolver(
+    fetch=lambda code: get_stock_name(code),
+    master_path=os.environ.get("STOCK_MASTER_FILE", "data/stock_master.csv"),
+    cached=lambda code: _cached_stock_name(code),
+    workers=NAME_RESOLVE_WORKERS,
+)
+
+# /metrics (Prometheus 形式)。METRICS_SAMPLE_RATE の割合のリクエストだけ段階別の所要時間を記録する
+metrics = PipelineMetrics(sample_rate=float(os.environ.get("METRICS_SAMPLE_RATE", 1)))
+metrics.collect_cache(scrape_cache)
+install_request_metrics(app, metrics)
+
+# 株探への GET。接続エラーと一時的な 5xx は UPSTREAM_RETRIES 回まで再試行し、再試行もスケジューラーのトークンを取る
+# 同時に株探へアクセスしうるのはリクエスト・ニュース取得・銘柄名解決のスレッドなので、その合計だけ接続を保持する
+upstream = UpstreamFetcher(
+    upstream_scheduler, metrics,
+    retries=int(os.environ.get("UPSTREAM_RETRIES", 1)),
+    pool_size=SERVER_THREADS + FETCH_WORKERS + NAME_RESOLVE_WORKERS,
+)
+fetch_upstream = upstream.get
+
+app.register_blueprint(watchlist_blueprint(favorites, name_resolver, lambda code: get_stock_name(code)))
+
 # ---------------------------------------------------------
 # 1. データの永続化と取得
 # ---------------------------------------------------------
 def load_favorites():
-    if os.path.exists(FAVORITES_FILE):
-        try:
-            with open(FAVORITES_FILE, "r") as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    # 旧形式を新形式に変換
-                    return {c: "" for c in data}
-                return data
-        except:
-            return {"6752": "パナソニック", "9434": "ソフトバンク"}
-    return {"6752": "パナソニック", "9434": "ソフトバンク"}
-
-def save_favorites(favs):
-    with open(FAVORITES_FILE, "w") as f:
-        json.dump(favs, f, ensure_ascii=False)
+    return favorites.all()
 
 def get_stock_details(stock_code):
-    if not stock_code or not re.match(r'^\d{4}$', stock_code):
+    if not stock_code or not CODE_RE.match(stock_code):
         return {}
-    url = f"https://kabutan.jp/stock/?code={stock_code}"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    try:
-        response = requests.get(url, headers=headers, timeout=5)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        details = {"code": stock_code}
-        
-        # 1. 銘柄名と市場
-        company_block = soup.find('div', class_='company_block')
-        if company_block:
-            h3 = company_block.find('h3')
-            if h3:
-                name = h3.get_text(strip=True)
-                details["name"] = re.sub(r'^\d{4}\s*', '', name)
-            market = company_block.find('span', class_='market')
-            details["market"] = market.get_text(strip=True) if market else "---"
-
-        # 2. 株価・前日比
-        kabuka_table = soup.find('table', class_='kabuka')
-        if kabuka_table:
-            tds = kabuka_table.find_all('td')
-            if len(tds) >= 4:
-                details["price"] = tds[0].get_text(strip=True)
-                details["change"] = tds[1].get_text(strip=True)
-                details["change_pct"] = tds[2].get_text(strip=True)
-                details["time"] = tds[3].get_text(strip=True)
-
-        # 3. 投資指標 (VWAP, 出来高, 利回り)
-        # stockinfo_i1, i2, i3 あたりから取得
-        for info_id in ['stockinfo_i1', 'stockinfo_i2', 'stockinfo_i3']:
-            info_div = soup.find('div', id=info_id)
-            if info_div:
-                dls = info_div.find_all('dl')
-                for dl in dls:
-                    dt = dl.find('dt').get_text(strip=True)
-                    dd = dl.find('dd').get_text(strip=True)
-                    if "VWAP" in dt: details["vwap"] = dd
-                    if "出来高" in dt: details["volume"] = dd
-                    if "利回り" in dt: details["yield"] = dd
-                    if "決算発表日" in dt or "決算日" in dt: details["earnings_date"] = dd
-
-        # 4. 信用残・乖離率 (さらに下のテーブル)
-        # 信用残テーブルを探す
-        margin_table = soup.find('table', class_='margin_table')
-        if margin_table:
-            rows = margin_table.find_all('tr')
-            for row in rows:
-                if "売残" in row.get_text():
-                    details["margin_sell"] = row.find_all('td')[1].get_text(strip=True)
-                if "買残" in row.get_text():
-                    details["margin_buy"] = row.find_all('td')[1].get_text(strip=True)
-                if "倍率" in row.get_text():
-                    details["margin_ratio"] = row.find_all('td')[1].get_text(strip=True)
-
-        # 5. 移動平均乖離率
-        kairi_table = soup.find('table', class_='kairi_table')
-        if kairi_table:
-            rows = kairi_table.find_all('tr')
-            for row in rows:
-                if "25日" in row.get_text():
-                    details["kairi_25"] = row.find_all('td')[1].get_text(strip=True)
-                if "75日" in row.get_text():
-                    details["kairi_75"] = row.find_all('td')[1].get_text(strip=True)
-
-        # 欠損値の埋め合わせ
-        placeholders = {
-            "name": "---", "market": "---", "price": "---", "change": "---", 
-            "change_pct": "---", "time": "---", "vwap": "---", "volume": "---",
-            "yield": "---", "earnings_date": "---", "margin_buy": "---", 
-            "margin_sell": "---", "margin_ratio": "---", "kairi_25": "---", "kairi_75": "---"
-        }
-        for k, v in placeholders.items():
-            if k not in details: details[k] = v
+    return scrape_cache.get_or_fetch_sync(
+        stock_code, "quote", lambda: _shared_load("quote", stock_code, lambda: _fetch_stock_details(stock_code))) or {}
+
+def _cached_stock_name(stock_code):
+    details, _ = scrape_cache.lookup(stock_code, "quote")
+    name = (details or {}).get("name")
+    return None if not name or name == "---" else name
+
+def get_stock_name(stock_code):
+    # 詳細ページのキャッシュを流用する
+    name = get_stock_details(stock_code).get("name", "")
+    return "" if name == "---" else name
 
-        return details
+def _fetch_stock_details(stock_code):
+    url = f"{KABUTAN_BASE_URL}/stock/?code={stock_code}"
+    try:
+        response = fetch_upstream(url, "quote")
+        # エラーページ (429 / 5xx など) はパースもキャッシュもしない
+        if response.status_code != 200:
+            return None
+        with metrics.span("parse", "quote"):
+            return _parse_stock_details(response.text, stock_code)
     except:
-        return {}
+        return None
+
+def _parse_stock_details(html, stock_code):
+    soup = make_detail_soup(html)
+    
+    details = {"code": stock_code}
+    
+    # 1. 銘柄名と市場
+    company_block = soup.find('div', class_='company_block')
+    if company_block:
+        h3 = company_block.find('h3')
+        if h3:
+            name = h3.get_text(strip=True)
+            details["name"] = CODE_PREFIX_RE.sub('', name)
+        market = company_block.find('span', class_='market')
+        details["market"] = market.get_text(strip=True) if market else "---"
+
+    # 2. 株価・前日比
+    kabuka_table = soup.find('table', class_='kabuka')
+    if kabuka_table:
+        tds = kabuka_table.find_all('td')
+        if len(tds) >= 4:
+            details["price"] = tds[0].get_text(strip=True)
+            details["change"] = tds[1].get_text(strip=True)
+            details["change_pct"] = tds[2].get_text(strip=True)
+            details["time"] = tds[3].get_text(strip=True)
+
+    # 3. 投資指標 (VWAP, 出来高, 利回り)
+    # stockinfo_i1, i2, i3 あたりから取得
+    for info_id in ['stockinfo_i1', 'stockinfo_i2', 'stockinfo_i3']:
+        info_div = soup.find('div', id=info_id)
+        if info_div:
+            dls = info_div.find_all('dl')
+            for dl in dls:
+                dt = dl.find('dt').get_text(strip=True)
+                dd = dl.find('dd').get_text(strip=True)
+                if "VWAP" in dt: details["vwap"] = dd
+                if "出来高" in dt: details["volume"] = dd
+                if "利回り" in dt: details["yield"] = dd
+                if "決算発表日" in dt or "決算日" in dt: details["earnings_date"] = dd
+
+    # 4. 信用残・乖離率 (さらに下のテーブル)
+    # 信用残テーブルを探す
+    margin_table = soup.find('table', class_='margin_table')
+    if margin_table:
+        rows = margin_table.find_all('tr')
+        for row in rows:
+            if "売残" in row.get_text():
+                details["margin_sell"] = row.find_all('td')[1].get_text(strip=True)
+            if "買残" in row.get_text():
+                details["margin_buy"] = row.find_all('td')[1].get_text(strip=True)
+            if "倍率" in row.get_text():
+                details["margin_ratio"] = row.find_all('td')[1].get_text(strip=True)
+
+    # 5. 移動平均乖離率
+    kairi_table = soup.find('table', class_='kairi_table')
+    if kairi_table:
+        rows = kairi_table.find_all('tr')
+        for row in rows:
+            if "25日" in row.get_text():
+                details["kairi_25"] = row.find_all('td')[1].get_text(strip=True)
+            if "75日" in row.get_text():
+                details["kairi_75"] = row.find_all('td')[1].get_text(strip=True)
+
+    # 欠損値の埋め合わせ
+    placeholders = {
+        "name": "---", "market": "---", "price": "---", "change": "---", 
+        "change_pct": "---", "time": "---", "vwap": "---", "volume": "---",
+        "yield": "---", "earnings_date": "---", "margin_buy": "---", 
+        "margin_sell": "---", "margin_ratio": "---", "kairi_25": "---", "kairi_75": "---"
+    }
+    for k, v in placeholders.items():
+        if k not in details: details[k] = v
+
+    return details
+
+def get_stock_page(stock_code):
+    """詳細とニュースを並行して取得する (ニュースは取得用スレッド、詳細はこのスレッド)"""
+    news = fetch_executor.submit(get_kabutan_news, stock_code)
+    details = get_stock_details(stock_code)
+    return details, news.result()
 
 def get_kabutan_news(stock_code):
-    url = f"https://kabutan.jp/stock/news?code={stock_code}"
-    headers = {"User-Agent": "Mozilla/5.0"}
+    return scrape_cache.get_or_fetch_sync(
+        stock_code, "news", lambda: _shared_load("news", stock_code, lambda: _fetch_kabutan_news(stock_code))) or []
+
+def _fetch_kabutan_news(stock_code):
+    url = f"{KABUTAN_BASE_URL}/stock/news?code={stock_code}"
     try:
-        response = requests.get(url, headers=headers, timeout=5)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        news_items = []
-        table = soup.find('table', class_='s_news_list')
-        if table:
-            rows = table.find_all('tr')
-            for row in rows:
-                time_td = row.find('td', class_='date')
-                time_str = time_td.get_text(strip=True) if time_td else ""
-                link_tag = row.find('a')
-                if link_tag:
-                    title = link_tag.get_text(strip=True)
-                    href = link_tag.get('href')
-                    if not href.startswith('http'):
-                        href = f"https://kabutan.jp{href}"
-                    news_items.append({"title": f"[{time_str}] {title}", "url": href})
-                if len(news_items) >= 15: break
-        return news_items
+        response = fetch_upstream(url, "news")
+        # エラーページ (429 / 5xx など) はパースもキャッシュもしない
+        if response.status_code != 200:
+            return None
+        with metrics.span("parse", "news"):
+            return _parse_kabutan_news(response.text)
     except:
-        return []
+        return None
+
+def _parse_kabutan_news(html):
+    soup = make_soup(html, NEWS_SCOPE)
+    news_items = []
+    table = soup.find('table', class_='s_news_list')
+    if table:
+        rows = table.find_all('tr')
+        for row in rows:
+            time_td = row.find('td', class_='date')
+            time_str = time_td.get_text(strip=True) if time_td else ""
+            link_tag = row.find('a')
+            if link_tag:
+                title = link_tag.get_text(strip=True)
+                href = link_tag.get('href')
+                if not href.startswith('http'):
+                    href = f"{KABUTAN_BASE_URL}{href}"
+                news_items.append({"title": f"[{time_str}] {title}", "url": href})
+            if len(news_items) >= 15: break
+    return news_items
 
 # ---------------------------------------------------------
 # 2. ルート定義
@@ -153,8 +263,7 @@ def index():
     if not current_code:
         current_code = list(favs.keys())[0] if favs else "7203"
     
-    details = get_stock_details(current_code)
-    news = get_kabutan_news(current_code)
+    details, news = get_stock_page(current_code)
     
     return render_template("index.html", 
                            favorites=favs, 
@@ -165,8 +274,7 @@ def index():
 @app.route("/stock/<codeSegment>")
 def stock_panel(codeSegment):
     """HTMX用：銘柄詳細パネルのみを返す"""
-    details = get_stock_details(codeSegment)
-    news = get_kabutan_news(codeSegment)
+    details, news = get_stock_page(codeSegment)
     return render_template("partials/stock_panel.html", 
                            current_code=codeSegment, 
                            stock=details, 
@@ -175,59 +283,170 @@ def stock_panel(codeSegment):
 @app.route("/api/stock_data/<code>")
 def get_historical_data(code):
     """チャート描画用の数値を返す"""
+    import yfinance as yf
+
     try:
         # 日本株の場合は .T を付与（とりあえず東証前提）
         ticker_code = f"{code}.T"
-        ticker = yf.Ticker(ticker_code)
-        # 直近6ヶ月分のデータを取得
-        df = ticker.history(period="6mo")
-        
-        if df.empty:
+        if history_store is None:
+            # 直近6ヶ月分のデータを取得
+            df = yf.Ticker(ticker_code).history(period="6mo")
+            if df.empty:
+                # 存在しない銘柄では日付の Index を持たない空の DataFrame が返る
+                return jsonify({"error": "No data found"}), 404
+            bars = _frame_to_bars(df)
+        else:
+            # 初回は 6 ヶ月分、以降は最終保存日の前の確定足からの差分だけを取得して追記する
+            if not history_store.is_fresh(OHLCV_SOURCE, code, OHLCV_SYNC_INTERVAL):
+                ticker = yf.Ticker(ticker_code)
+                since = history_store.sync_start(OHLCV_SOURCE, code)
+                df = ticker.history(start=since) if since else ticker.history(period="6mo")
+                if since and not df.empty and not history_store.matches(OHLCV_SOURCE, code, _frame_to_bars(df)):
+                    # 分割・配当で過去の足が調整し直されたので、蓄積分を捨てて全期間を取り直す
+                    history_store.delete(OHLCV_SOURCE, code)
+                    df = ticker.history(period="6mo")
+                if not df.empty:
+                    history_store.merge(OHLCV_SOURCE, code, _frame_to_bars(df))
+            start = (date.today() - timedelta(days=183)).isoformat()
+            bars = history_store.load(OHLCV_SOURCE, code, start=start)
+
+        if not bars["date"]:
             return jsonify({"error": "No data found"}), 404
-            
-        data = []
-        for index, row in df.iterrows():
-            data.append({
-                "time": index.strftime('%Y-%m-%d'),
-                "open": float(row['Open']),
-                "high": float(row['High']),
-                "low": float(row['Low']),
-                "close": float(row['Close'])
-            })
+
+        columns = {
+            "time": bars["date"],
+            "open": bars["open"],
+            "high": bars["high"],
+            "low": bars["low"],
+            "close": bars["close"],
+        }
+        if request.args.get("format") == "columns":
+            return jsonify(columns)
+        keys = list(columns)
+        data = [dict(zip(keys, row)) for row in zip(*columns.values())]
         return jsonify(data)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/favorites/add", methods=["POST"])
-def add_favorite():
-    code = request.form.get("code")
-    if code and re.match(r'^\d{4}$', code):
-        favs = load_favorites()
-        if code not in favs:
-            name = get_stock_name(code)
-            favs[code] = name
-            save_favorites(favs)
-    return render_template("partials/watchlist.html", favorites=load_favorites())
-
-@app.route("/favorites/remove", methods=["POST"])
-def remove_favorite():
-    code = request.form.get("code")
-    favs = load_favorites()
-    if code in favs:
-        del favs[code]
-        save_favorites(favs)
-    return render_template("partials/watchlist.html", favorites=load_favorites())
-
-@app.route("/favorites/import", methods=["POST"])
-def import_favorites():
-    text = request.form.get("text")
-    codes = re.findall(r'\b(\d{4})\b', text)
-    favs = load_favorites()
-    for c in codes:
-        if c not in favs:
-            favs[c] = get_stock_name(c)
-    save_favorites(favs)
-    return render_template("partials/watchlist.html", favorites=load_favorites())
+# /api/stock_data?codes=... の銘柄数上限と、yfinance が受け付ける期間・足の種類
+CHART_MAX_CODES = int(os.environ.get("CHART_MAX_CODES", 20))
+CHART_PERIODS = ("1d", "5d", "1mo", "3mo", "6mo", "1y", "2y", "5y", "10y", "ytd", "max")
+CHART_INTERVALS = ("1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h", "1d", "5d", "1wk", "1mo", "3mo")
+INTRADAY_INTERVALS = ("1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h")
+
+@app.route("/api/stock_data")
+def get_chart_data():
+    """複数銘柄のチャート用データを列形式で返す
+
+    例: /api/stock_data?codes=7203,6758&period=6mo&interval=1d
+    (code, period, interval) 単位でキャッシュし、キャッシュに無い銘柄だけを yf.download 1 回でまとめて取得する。
+    """
+    codes = list(dict.fromkeys(c.strip() for c in request.args.get("codes", "").split(",") if c.strip()))
+    period = request.args.get("period", "6mo")
+    interval = request.args.get("interval", "1d")
+    if not codes:
+        return jsonify({"error": "codes is required"}), 400
+    invalid = [c for c in codes if not CODE_RE.match(c)]
+    if invalid:
+        return jsonify({"error": f"Invalid codes: {', '.join(invalid)}"}), 400
+    if len(codes) > CHART_MAX_CODES:
+        return jsonify({"error": f"Too many codes (max {CHART_MAX_CODES})"}), 400
+    if period not in CHART_PERIODS or interval not in CHART_INTERVALS:
+        return jsonify({"error": "Invalid period or interval"}), 400
+
+    data, missing = {}, {}
+    for code in codes:
+        bars, fresh = scrape_cache.lookup((code, period, interval), "chart")
+        if fresh:
+            data[code] = bars
+        else:
+            missing[code] = bars   # 期限切れの値 (取得に失敗した時に使う) か None
+
+    if missing:
+        try:
+            fetched = _download_charts(list(missing), period, interval)
+        except Exception:
+            fetched = {}
+        for code, stale in missing.items():
+            bars = fetched.get(code)
+            if bars is not None:
+                scrape_cache.set((code, period, interval), "chart", bars)
+                data[code] = bars
+            elif stale is not None:
+                data[code] = stale
+
+    return jsonify({
+        "period": period,
+        "interval": interval,
+        "data": {code: data[code] for code in codes if code in data},
+        "errors": {code: "No data found" for code in codes if code not in data},
+    })
+
+def _download_charts(codes, period, interval):
+    """yf.download 1 回で複数銘柄を取得し、銘柄ごとの列 dict にする"""
+    import yfinance as yf
+
+    tickers = [f"{code}.T" for code in codes]
+    try:
+        with metrics.span("download", "chart"):
+            df = yf.download(tickers, period=period, interval=interval, group_by="ticker",
+                             threads=True, progress=False)
+    except Exception:
+        metrics.upstream("chart", 0)
+        raise
+    metrics.upstream("chart", 200)
+    result = {}
+    if df is None or df.empty:
+        return result
+    intraday = interval in INTRADAY_INTERVALS
+    for code, ticker in zip(codes, tickers):
+        if df.columns.nlevels > 1:
+            if ticker not in df.columns.get_level_values(0):
+                continue
+            frame = df[ticker]
+        else:
+            frame = df
+        # 一括取得では全銘柄の日付がそろえられるので、その銘柄の値が無い行を落とす
+        frame = frame.dropna(subset=["Open", "High", "Low", "Close"])
+        if frame.empty:
+            continue
+        bars = _frame_to_bars(frame, intraday)
+        result[code] = {"time": bars.pop("date"), **bars}
+    return result
+
+def _frame_to_bars(df, intraday=False):
+    """yfinance の DataFrame を列の dict に変換する (行ごとの iterrows は使わない)
+
+    intraday=True なら日時を UNIX 秒 (lightweight-charts の time 形式) にする。
+    """
+    return {
+        "date": df.index.as_unit("s").asi8.tolist() if intraday else df.index.strftime('%Y-%m-%d').tolist(),
+        "open": df['Open'].astype(float).tolist(),
+        "high": df['High'].astype(float).tolist(),
+        "low": df['Low'].astype(float).tolist(),
+        "close": df['Close'].astype(float).tolist(),
+        "volume": df['Volume'].fillna(0).astype('int64').tolist(),
+    }
+
+@app.route("/api/cache_stats")
+def cache_stats():
+    return jsonify(scrape_cache.stats())
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route("/api/upstream_stats")
+def upstream_stats():
+    return jsonify(upstream_scheduler.stats())
+
+# yfinance (pandas / numpy) は読み込みに 0.5 秒ほどかかり、使うのはチャート API だけなので、
+# 既定では初回呼び出しまで import しない (サーバーレスのコールドスタート向け)。
+# 常駐サーバーでは PRELOAD_YFINANCE=1 で起動後に裏で読み込み、最初のチャート表示を待たせない。
+if os.environ.get("PRELOAD_YFINANCE") == "1":
+    threading.Thread(target=importlib.import_module, args=("yfinance",), daemon=True).start()
+if os.environ.get("WARM_TEMPLATES") == "1":
+    warm_templates(app)
 
 if __name__ == "__main__":
     # GCP (Cloud Run) のポート番号に対応
@@ -1,78 +1,155 @@
 import os
-import json
-import re
-import requests
-from bs4 import BeautifulSoup
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from flask_cors import CORS
+from backend.services.cache import ResponseCache
+from backend.services.favorites import FavoritesRepository
+from backend.services.flask_support import (
+    CODE_PREFIX_RE, CODE_RE, UpstreamFetcher, install_request_metrics, shared_loader, warm_templates,
+    watchlist_blueprint,
+)
+from backend.services.metrics import PipelineMetrics
+from backend.services.name_resolver import NameResolver
+from backend.services.parsing import NAME_SCOPE, NEWS_SCOPE, make_soup
+from backend.services.scheduler import UpstreamScheduler
+from backend.services.shared_store import SharedTier, open_shared_store
 
 app = Flask(__name__)
 CORS(app)
 
 FAVORITES_FILE = "favorites.json"
 
+# 株探の URL (負荷試験ではローカルのスタブサーバーに向ける)
+KABUTAN_BASE_URL = os.environ.get("KABUTAN_BASE_URL", "https://kabutan.jp")
+
+# ウォッチリストはメモリに保持し、ファイルが更新された時だけ読み直す。書き込みはまとめて原子的に行う
+favorites = FavoritesRepository(FAVORITES_FILE, default={"6752": "パナソニック", "9434": "ソフトバンク"})
+
+# 株探スクレイピング結果のキャッシュ (秒)。期限切れ後も CACHE_MAX_STALE 秒は古い値を返しつつ裏で再取得する
+scrape_cache = ResponseCache(
+    ttls={
+        "news": float(os.environ.get("CACHE_TTL_NEWS", 120)),
+        "name": float(os.environ.get("CACHE_TTL_NAME", 86400)),
+    },
+    max_stale=float(os.environ.get("CACHE_MAX_STALE", 300)),
+    max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", 2048)),
+)
+
+# gunicorn の複数ワーカーで共有するキャッシュ・プロセス間ロック・レート制御
+# SHARED_STORE_URL に SQLite のパス (同一ホスト) か redis://... を指定すると有効 (空なら共有しない)
+shared_store = open_shared_store(os.environ.get("SHARED_STORE_URL", ""))
+shared_tier = SharedTier(shared_store, namespace="tradeinfo-flask-v2") if shared_store else None
+_shared_load = shared_loader(shared_tier, scrape_cache)
+
+# 株探へのアクセスはすべてスケジューラーを通す (トークンバケット + 優先レーン + 429/5xx バックオフ)
+upstream_scheduler = UpstreamScheduler(
+    rate=float(os.environ.get("UPSTREAM_RATE", 5)),
+    burst=float(os.environ.get("UPSTREAM_BURST", 10)),
+    host_rate=float(os.environ.get("UPSTREAM_HOST_RATE", 3)),
+    host_burst=float(os.environ.get("UPSTREAM_HOST_BURST", 6)),
+    slow_threshold=float(os.environ.get("UPSTREAM_SLOW_THRESHOLD", 3)),
+    shared=shared_store,
+)
+
+# 銘柄名の解決: 銘柄マスター CSV (STOCK_MASTER_FILE: コード,銘柄名) → キャッシュ → 株探 (NAME_RESOLVE_WORKERS 並列)
+NAME_RESOLVE_WORKERS = int(os.environ.get("NAME_RESOLVE_WORKERS", 8))
+# リクエストを処理するスレッド数 (gunicorn の --threads と同じ値にする)
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", 8))
+name_resolver = NameResolver(
+    fetch=lambda code: get_stock_name(code),
+    master_path=os.environ.get("STOCK_MASTER_FILE", "data/stock_master.csv"),
+    cached=lambda code: _cached_stock_name(code),
+    workers=NAME_RESOLVE_WORKERS,
+)
+
+# /metrics (Prometheus 形式)。METRICS_SAMPLE_RATE の割合のリクエストだけ段階別の所要時間を記録する
+metrics = PipelineMetrics(sample_rate=float(os.environ.get("METRICS_SAMPLE_RATE", 1)))
+metrics.collect_cache(scrape_cache)
+install_request_metrics(app, metrics)
+
+# 株探への GET は keep-alive のセッションで使い回す。接続エラーと一時的な 5xx は UPSTREAM_RETRIES 回まで
+# 再試行し、再試行もスケジューラーのトークンを取る。接続はリクエストと銘柄名解決のスレッドの合計だけ保持する
+upstream = UpstreamFetcher(
+    upstream_scheduler, metrics,
+    retries=int(os.environ.get("UPSTREAM_RETRIES", 1)),
+    pool_size=SERVER_THREADS + NAME_RESOLVE_WORKERS,
+)
+fetch_upstream = upstream.get
+
+app.register_blueprint(watchlist_blueprint(favorites, name_resolver, lambda code: get_stock_name(code)))
+
 # ---------------------------------------------------------
 # 1. データの永続化と取得
 # ---------------------------------------------------------
 def load_favorites():
-    if os.path.exists(FAVORITES_FILE):
-        try:
-            with open(FAVORITES_FILE, "r") as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    return {c: "" for c in data}
-                return data
-        except:
-            return {"6752": "パナソニック", "9434": "ソフトバンク"}
-    return {"6752": "パナソニック", "9434": "ソフトバンク"}
-
-def save_favorites(favs):
-    with open(FAVORITES_FILE, "w") as f:
-        json.dump(favs, f, ensure_ascii=False)
+    return favorites.all()
+
+def _cached_stock_name(stock_code):
+    name, _ = scrape_cache.lookup(stock_code, "name")
+    return name or None
 
 def get_stock_name(stock_code):
-    if not stock_code or not re.match(r'^\d{4}$', stock_code):
+    if not stock_code or not CODE_RE.match(stock_code):
         return ""
-    url = f"https://kabutan.jp/stock/?code={stock_code}"
-    headers = {"User-Agent": "Mozilla/5.0"}
+    return scrape_cache.get_or_fetch_sync(
+        stock_code, "name", lambda: _shared_load("name", stock_code, lambda: _fetch_stock_name(stock_code))) or ""
+
+def _fetch_stock_name(stock_code):
+    url = f"{KABUTAN_BASE_URL}/stock/?code={stock_code}"
     try:
-        response = requests.get(url, headers=headers, timeout=5)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        title = soup.find('div', class_='company_block')
-        if title:
-            h3 = title.find('h3')
-            if h3:
-                name = h3.get_text(strip=True)
-                name = re.sub(r'^\d{4}\s*', '', name)
-                return name
-        return ""
+        response = fetch_upstream(url, "name")
+        # エラーページ (429 / 5xx など) はパースもキャッシュもしない
+        if response.status_code != 200:
+            return None
+        with metrics.span("parse", "name"):
+            return _parse_stock_name(response.text)
     except:
-        return ""
+        return None
+
+def _parse_stock_name(html):
+    soup = make_soup(html, NAME_SCOPE)
+    title = soup.find('div', class_='company_block')
+    if title:
+        h3 = title.find('h3')
+        if h3:
+            name = h3.get_text(strip=True)
+            name = CODE_PREFIX_RE.sub('', name)
+            return name
+    return ""
 
 def get_kabutan_news(stock_code):
-    url = f"https://kabutan.jp/stock/news?code={stock_code}"
-    headers = {"User-Agent": "Mozilla/5.0"}
+    return scrape_cache.get_or_fetch_sync(
+        stock_code, "news", lambda: _shared_load("news", stock_code, lambda: _fetch_kabutan_news(stock_code))) or []
+
+def _fetch_kabutan_news(stock_code):
+    url = f"{KABUTAN_BASE_URL}/stock/news?code={stock_code}"
     try:
-        response = requests.get(url, headers=headers, timeout=5)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        news_items = []
-        table = soup.find('table', class_='s_news_list')
-        if table:
-            rows = table.find_all('tr')
-            for row in rows:
-                time_td = row.find('td', class_='date')
-                time_str = time_td.get_text(strip=True) if time_td else ""
-                link_tag = row.find('a')
-                if link_tag:
-                    title = link_tag.get_text(strip=True)
-                    href = link_tag.get('href')
-                    if not href.startswith('http'):
-                        href = f"https://kabutan.jp{href}"
-                    news_items.append({"title": f"[{time_str}] {title}", "url": href})
-                if len(news_items) >= 15: break
-        return news_items
+        response = fetch_upstream(url, "news")
+        # エラーページ (429 / 5xx など) はパースもキャッシュもしない
+        if response.status_code != 200:
+            return None
+        with metrics.span("parse", "news"):
+            return _parse_kabutan_news(response.text)
     except:
-        return []
+        return None
+
+def _parse_kabutan_news(html):
+    soup = make_soup(html, NEWS_SCOPE)
+    news_items = []
+    table = soup.find('table', class_='s_news_list')
+    if table:
+        rows = table.find_all('tr')
+        for row in rows:
+            time_td = row.find('td', class_='date')
+            time_str = time_td.get_text(strip=True) if time_td else ""
+            link_tag = row.find('a')
+            if link_tag:
+                title = link_tag.get_text(strip=True)
+                href = link_tag.get('href')
+                if not href.startswith('http'):
+                    href = f"{KABUTAN_BASE_URL}{href}"
+                news_items.append({"title": f"[{time_str}] {title}", "url": href})
+            if len(news_items) >= 15: break
+    return news_items
 
 # ---------------------------------------------------------
 # 2. ルート定義
@@ -109,36 +186,20 @@ def stock_panel(codeSegment):
                            stock_name=name, 
                            news=news)
 
-@app.route("/favorites/add", methods=["POST"])
-def add_favorite():
-    code = request.form.get("code")
-    if code and re.match(r'^\d{4}$', code):
-        favs = load_favorites()
-        if code not in favs:
-            name = get_stock_name(code)
-            favs[code] = name
-            save_favorites(favs)
-    return render_template("partials/watchlist.html", favorites=load_favorites())
-
-@app.route("/favorites/remove", methods=["POST"])
-def remove_favorite():
-    code = request.form.get("code")
-    favs = load_favorites()
-    if code in favs:
-        del favs[code]
-        save_favorites(favs)
-    return render_template("partials/watchlist.html", favorites=load_favorites())
-
-@app.route("/favorites/import", methods=["POST"])
-def import_favorites():
-    text = request.form.get("text")
-    codes = re.findall(r'\b(\d{4})\b', text)
-    favs = load_favorites()
-    for c in codes:
-        if c not in favs:
-            favs[c] = get_stock_name(c)
-    save_favorites(favs)
-    return render_template("partials/watchlist.html", favorites=load_favorites())
+@app.route("/api/cache_stats")
+def cache_stats():
+    return jsonify(scrape_cache.stats())
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route("/api/upstream_stats")
+def upstream_stats():
+    return jsonify(upstream_scheduler.stats())
+
+if os.environ.get("WARM_TEMPLATES") == "1":
+    warm_templates(app)
 
 if __name__ == "__main__":
     app.run(debug=True, port=5001)
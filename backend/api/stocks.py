@@ -1,16 +1,200 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+from typing import List, Literal, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from core.config import settings
+from services.favorites import FavoritesRepository
+from services.indicators import INDICATORS
 from services.kabutan import KabutanService
-from schemas.stock import StockDetails
+from services.market_calendar import MarketCalendar
+from services.quote_stream import QuoteHub
+from services.refresher import MarketRefresher
+from services.scheduler import BACKGROUND, priority
+from services.snapshot import ScreenError
+from services.telemetry import metrics
+from services.watchlist import WatchlistRegistry
+from schemas.stock import BatchRequest, OHLCV, StockDetails, WatchlistRequest
 
 router = APIRouter(prefix="/stocks", tags=["stocks"])
-service = KabutanService()
+calendar = MarketCalendar(settings.market_holidays.split(","), warm_lead_minutes=settings.warm_lead_minutes)
+service = KabutanService(calendar=calendar)
+quote_hub = QuoteHub(service, settings.stream_interval, calendar=calendar)
+watchlist = WatchlistRegistry(
+    FavoritesRepository(settings.watchlist_file) if settings.watchlist_file else None,
+    max_codes=settings.batch_max_codes,
+)
+refresher = MarketRefresher(service, calendar, watchlist, settings.refresh_interval, settings.refresh_concurrency)
+
+def _field_mask(fields: List[str]) -> Optional[set]:
+    """返すフィールドの集合 (code は常に含める)。空なら None (全フィールド)"""
+    unknown = [f for f in fields if f not in StockDetails.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return set(fields) | {"code"} if fields else None
+
+@router.post("/batch")
+async def get_stocks_batch(req: BatchRequest):
+    """複数銘柄をまとめて取得し、完了した順に NDJSON (1 行 1 銘柄) で返す"""
+    codes = list(dict.fromkeys(c.strip() for c in req.codes if c.strip()))
+    if len(codes) > settings.batch_max_codes:
+        raise HTTPException(status_code=400, detail=f"Too many codes (max {settings.batch_max_codes})")
+    include = _field_mask(req.fields)
+    parts = service.parts_for(req.fields) if req.fields else service.PARTS
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+
+    async def fetch_one(code: str) -> str:
+        # 一括取得は画面操作より低い優先度で上流にアクセスする
+        async with semaphore:
+            try:
+                with priority(BACKGROUND):
+                    details = await service.get_stock_details(code, parts, req.history_days)
+            except asyncio.TimeoutError:
+                return json.dumps({"code": code, "error": "upstream timeout"}, ensure_ascii=False)
+            except Exception as e:
+                return json.dumps({"code": code, "error": str(e)}, ensure_ascii=False)
+        if details.name == "Error":
+            return json.dumps({"code": code, "error": "Stock not found"}, ensure_ascii=False)
+        # 取得済みのモデルは検証し直さず、pydantic の JSON エンコーダーで直接書き出す
+        return details.model_dump_json(include=include)
+
+    async def stream():
+        tasks = [asyncio.create_task(fetch_one(code)) for code in codes]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/screen")
+async def screen_stocks(
+    where: Optional[str] = None,
+    sort: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    fields: Optional[str] = None,
+    scope: Literal["all", "watchlist"] = "all",
+):
+    """取得済み銘柄の数値指標で絞り込み・並べ替えを行う
+
+    例: /stocks/screen?where=margin_ratio < 1 and change_percent > 3&sort=-change_percent&limit=20
+    値は数値化済み (% はパーセント値、倍・株・円は単位なし)。scope=watchlist で監視銘柄に限る。
+    """
+    names = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    codes = watchlist.codes() if scope == "watchlist" else None
+    try:
+        with metrics.span("screen", "snapshot"):
+            result = service.snapshot.query(where, sort, limit, names, codes)
+    except ScreenError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return result
+
+@router.put("/watchlist")
+async def put_watchlist(req: WatchlistRequest):
+    """client の監視銘柄を置き換える (定期更新・寄り付き前の先読みの対象になる)"""
+    codes = watchlist.register(req.client, req.codes)
+    return {"client": req.client, "codes": codes, "market": calendar.stats()}
+
+@router.get("/stream")
+async def stream_quotes(request: Request, codes: str):
+    """Server-Sent Events で株価の変化分 (価格・前日比・出来高・VWAP) を配信する
+
+    例: /stocks/stream?codes=7203,9434
+    """
+    code_list = list(dict.fromkeys(c.strip() for c in codes.split(",") if c.strip()))
+    if not code_list:
+        raise HTTPException(status_code=400, detail="codes is required")
+    if len(code_list) > settings.stream_max_codes:
+        raise HTTPException(status_code=400, detail=f"Too many codes (max {settings.stream_max_codes})")
+
+    queue = quote_hub.subscribe(code_list)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.stream_heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: quote\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            quote_hub.unsubscribe(queue, code_list)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.get("/{code}", response_model=StockDetails)
-async def get_stock(code: str):
+async def get_stock(
+    code: str,
+    fields: Optional[str] = None,
+    history_days: Optional[int] = Query(None, ge=0),
+):
+    """銘柄詳細。fields=name,current_price,... で返すフィールドを、history_days で履歴の日数を絞る
+
+    サービスが組み立てたモデルをそのまま JSON にする (response_model による再検証・再変換をしない)。
+    """
+    names = [f.strip() for f in fields.split(",") if f.strip()] if fields else []
+    include = _field_mask(names)
+    parts = service.parts_for(names) if names else service.PARTS
     try:
-        details = await service.get_stock_details(code)
+        details = await service.get_stock_details(code, parts, history_days)
         if details.name == "Error":
             raise HTTPException(status_code=404, detail="Stock not found")
-        return details
+        with metrics.span("serialize", "details"):
+            body = details.model_dump_json(include=include)
+        return Response(body, media_type="application/json")
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        # 詳細ページが details_timeout 内に取れなかった (str(e) は空なので 500 と区別できるようにする)
+        raise HTTPException(status_code=504, detail="upstream timeout")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{code}/history", response_model=List[OHLCV])
+async def get_stock_history(
+    code: str,
+    format: Literal["json", "columns", "npz", "arrow"] = "json",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    indicators: Optional[str] = None,
+):
+    """日足履歴。format=columns は列指向 JSON、npz / arrow はバイナリで返す
+
+    start / end (YYYY-MM-DD) で期間を絞り込む (ローカル蓄積分から切り出す)。
+    indicators=ma25,rsi14,... を指定するとサーバー側で計算した指標列を追加する。
+    """
+    full = await service.get_history_columns(code)
+    window = full.range_slice(start, end)
+    history = full.between(start, end)
+
+    extra = None
+    if indicators:
+        names = [n.strip() for n in indicators.split(",") if n.strip()]
+        unknown = [n for n in names if n not in INDICATORS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown indicators: {', '.join(unknown)}")
+        # 指標は全期間で計算してから切り出す (移動平均の窓が期間外の足を使えるように)
+        extra = {name: values[window] for name, values in (await service.get_indicators(code, names)).items()}
+
+    if format == "columns":
+        return JSONResponse({"code": code, **history.to_columns(extra)})
+    if format == "npz":
+        return Response(history.to_npz(extra), media_type="application/octet-stream")
+    if format == "arrow":
+        try:
+            body = history.to_arrow(extra)
+        except ImportError:
+            raise HTTPException(status_code=400, detail="format=arrow requires pyarrow")
+        return Response(body, media_type="application/vnd.apache.arrow.stream")
+    if extra:
+        columns = history.to_columns(extra)
+        keys = list(columns)
+        return JSONResponse([dict(zip(keys, row)) for row in zip(*columns.values())])
+    return history.to_models()
@@ -0,0 +1,82 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """バックエンド設定（環境変数 / .env で上書き可能）"""
+
+    model_config = SettingsConfigDict(env_prefix="TRADEINFO_", env_file=".env", extra="ignore")
+
+    # 株探 (上流) への HTTP 接続プール
+    kabutan_base_url: str = "https://kabutan.jp"
+    http2: bool = True
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 30.0
+    http_max_connections_per_host: int = 6
+    http_connect_timeout: float = 5.0
+    http_read_timeout: float = 10.0
+    http_pool_timeout: float = 5.0
+
+    # 上流アクセスのレート制御 (req/s)。429/5xx や遅延時は自動で絞る
+    upstream_rate: float = 5.0
+    upstream_burst: float = 10.0
+    upstream_host_rate: float = 3.0
+    upstream_host_burst: float = 6.0
+    upstream_slow_threshold: float = 3.0
+
+    # HTML パーサー (lxml / html.parser / html5lib)。未インストールなら html.parser
+    html_parser: str = "lxml"
+    # HTML パースの実行先 (process / thread / inline) とワーカー数 (0 なら CPU コア数)
+    parse_executor: str = "process"
+    parse_workers: int = 0
+
+    # /stocks/{code} のページ別タイムアウト (秒)
+    details_timeout: float = 10.0
+    news_timeout: float = 6.0
+    history_timeout: float = 8.0
+
+    # スクレイピング結果のキャッシュ (TTL は秒、max_stale は期限切れ後に古い値を返せる猶予)
+    cache_ttl_quote: float = 15.0
+    cache_ttl_news: float = 120.0
+    cache_ttl_history: float = 600.0
+    cache_max_stale: float = 300.0
+    cache_max_entries: int = 2048
+    cache_max_bytes: int = 64 * 1024 * 1024
+
+    # 複数ワーカー (uvicorn --workers など) で共有するキャッシュ・ロック・レート制御
+    # 空文字なら共有しない。SQLite のパス (同一ホスト) か redis://host:6379/0 (要 redis パッケージ)
+    # shared_lock_ttl はプロセス間ロックの最長保持秒数 (保持したワーカーが落ちた時に解放される)
+    shared_store_url: str = ""
+    shared_lock_ttl: float = 30.0
+
+    # 日足のローカル蓄積 (SQLite)。空文字で無効化。同期後この秒数は上流を取得しない
+    history_store_path: str = "data/ohlcv.sqlite3"
+    history_sync_interval: float = 900.0
+
+    # POST /stocks/batch
+    batch_max_codes: int = 500
+    batch_concurrency: int = 8
+
+    # GET /stocks/stream (SSE): 銘柄ごとのポーリング間隔・1 接続あたりの上限銘柄数・無通信時の keep-alive 間隔
+    stream_interval: float = 5.0
+    stream_max_codes: int = 50
+    stream_heartbeat: float = 15.0
+
+    # GET /stocks/screen: スナップショットに保持する最大銘柄数
+    screen_max_rows: int = 5000
+
+    # 取引カレンダーに合わせたウォッチリストの定期更新と寄り付き前の先読み
+    # market_holidays は祝日以外の臨時休場日 (YYYY-MM-DD のカンマ区切り)
+    # watchlist_file は Flask 版のお気に入り (空文字なら読まない)
+    refresh_enabled: bool = True
+    refresh_interval: float = 60.0
+    refresh_concurrency: int = 4
+    warm_lead_minutes: float = 15.0
+    market_holidays: str = ""
+    watchlist_file: str = "../favorites.json"
+
+    # /metrics の段階別所要時間を記録するリクエストの割合 (0-1)。件数系のカウンターは常に数える
+    metrics_sample_rate: float = 1.0
+
+
+settings = Settings()
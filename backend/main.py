@@ -1,8 +1,28 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from api.stocks import router as stocks_router
+from fastapi.responses import Response
+from api.stocks import router as stocks_router, quote_hub, refresher, service
+from core.config import settings
+from services.http_client import upstream
+from services.telemetry import metrics
 
-app = FastAPI(title="TradeInfo API", version="3.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # パース用のワーカープロセスは他のスレッドが動き出す前に用意する
+    service.parse_pool.start()
+    # 株探への接続プールはアプリの生存期間で共有する
+    await upstream.start()
+    if settings.refresh_enabled:
+        refresher.start()
+    yield
+    await refresher.close()
+    await quote_hub.close()
+    service.parse_pool.close()
+    await upstream.close()
+
+app = FastAPI(title="TradeInfo API", version="3.0.0", lifespan=lifespan)
 
 # CORS設定
 app.add_middleware(
@@ -15,10 +35,47 @@ app.add_middleware(
 
 app.include_router(stocks_router)
 
+# 既存の統計値も /metrics に出す
+metrics.collect_cache(service.cache)
+metrics.collect(
+    "tradeinfo_upstream_connections_total", "counter", "Upstream connections by outcome", ("outcome",),
+    lambda: {("opened",): upstream.connections_opened,
+             ("reused",): max(upstream.requests - upstream.connections_opened, 0)})
+metrics.collect(
+    "tradeinfo_singleflight_calls_total", "counter", "Single-flight calls by outcome", ("outcome",),
+    lambda: {("executed",): service.flight.executions, ("coalesced",): service.flight.coalesced})
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # ルート単位の応答時間・ステータス。配下の段階別 span も同じ抽選結果で記録する
+    with metrics.request_scope() as sampled:
+        started = time.perf_counter()
+        response = await call_next(request)
+        elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    metrics.response(route.path if route is not None else "unmatched", response.status_code,
+                     elapsed if sampled else None)
+    return response
+
 @app.get("/")
 async def root():
     return {"message": "TradeInfo API v3 is running"}
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "upstream": upstream.stats(),
+        "scheduler": upstream.scheduler.stats(),
+        "cache": service.cache.stats(),
+        "singleflight": service.flight.stats(),
+        "parse_pool": service.parse_pool.stats(),
+        "stream": quote_hub.stats(),
+        "refresher": refresher.stats(),
+        "snapshot": service.snapshot.stats(),
+        "shared": service.shared.stats() if service.shared is not None else None,
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
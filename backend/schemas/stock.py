@@ -31,3 +31,17 @@ class StockDetails(BaseModel):
     settlement_date: Optional[str] = None
     news: List[NewsItem] = []
     history: List[OHLCV] = []
+    # 取得に失敗し空で返したパーツ ("news" / "history")
+    degraded: List[str] = []
+
+class BatchRequest(BaseModel):
+    codes: List[str]
+    # 返すフィールド (空なら全フィールド)。例: ["name", "current_price", "change_percent"]
+    fields: List[str] = []
+    # 履歴を直近何日分返すか (None なら全件)
+    history_days: Optional[int] = Field(None, ge=0)
+
+class WatchlistRequest(BaseModel):
+    codes: List[str]
+    # 登録元 (ダッシュボードのタブなど)。同じ client の登録は置き換える
+    client: str = "default"
@@ -0,0 +1,209 @@
+import asyncio
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# スクレイピング結果・履歴のメモリキャッシュ (TTL + LRU + stale-while-revalidate)
+
+
+def estimate_size(value: Any, _seen: Optional[set] = None) -> int:
+    """キャッシュ値のおおよそのバイト数 (LRU のバイト上限判定用)"""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        return size + sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(v, _seen) for v in value)
+    if hasattr(value, "__dict__"):
+        return size + estimate_size(vars(value), _seen)
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "size", "stored_at", "ttl")
+
+    def __init__(self, value: Any, size: int, ttl: float):
+        self.value = value
+        self.size = size
+        self.stored_at = time.monotonic()
+        self.ttl = ttl
+
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+
+class ResponseCache:
+    """(code, kind) 単位の TTL + LRU キャッシュ
+
+    - kind ごとに TTL を変えられる (quote / news / history など)
+    - エントリ数とおおよそのバイト数の両方で LRU 追い出し
+    - stale-while-revalidate: TTL 切れでも max_stale 秒以内なら古い値を即返し、
+      裏で再取得する
+    - ttl_policy(kind, 基本 TTL) を渡すと保存時の TTL を調整できる (取引時間外は長くするなど)
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 60.0,
+        max_stale: float = 300.0,
+        max_entries: int = 1024,
+        max_bytes: int = 32 * 1024 * 1024,
+        sizeof: Callable[[Any], int] = estimate_size,
+        ttl_policy: Optional[Callable[[str, float], float]] = None,
+    ):
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.ttl_policy = ttl_policy
+        self._entries: "OrderedDict[Tuple[Hashable, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._refreshing: set = set()
+        self._tasks: set = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def ttl_for(self, kind: str) -> float:
+        ttl = self.ttls.get(kind, self.default_ttl)
+        return self.ttl_policy(kind, ttl) if self.ttl_policy is not None else ttl
+
+    # ---------------------------------------------------------
+    # 基本操作
+    # ---------------------------------------------------------
+    def lookup(self, code: Hashable, kind: str) -> Tuple[Optional[Any], bool]:
+        """(値, 鮮度内か) を返す。無い / 完全に期限切れなら (None, False)"""
+        key = (code, kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+            age = entry.age()
+            if age > entry.ttl + self.max_stale:
+                self._remove(key)
+                self.misses += 1
+                return None, False
+            self._entries.move_to_end(key)
+            if age <= entry.ttl:
+                self.hits += 1
+                return entry.value, True
+            self.stale_hits += 1
+            return entry.value, False
+
+    def set(self, code: Hashable, kind: str, value: Any, size: Optional[int] = None) -> None:
+        if value is None:
+            return
+        key = (code, kind)
+        size = self.sizeof(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, size, self.ttl_for(kind))
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, code: Hashable, kind: Optional[str] = None) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == code and (kind is None or k[1] == kind)]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    # ---------------------------------------------------------
+    # 取得ヘルパー (None を返した loader の結果はキャッシュしない)
+    # ---------------------------------------------------------
+    async def get_or_fetch(self, code: Hashable, kind: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value, fresh = self.lookup(code, kind)
+        if value is not None:
+            if not fresh:
+                self._refresh_async(code, kind, loader)
+            return value
+        value = await loader()
+        self.set(code, kind, value)
+        return value
+
+    def get_or_fetch_sync(self, code: Hashable, kind: str, loader: Callable[[], Any]) -> Any:
+        value, fresh = self.lookup(code, kind)
+        if value is not None:
+            if not fresh:
+                self._refresh_sync(code, kind, loader)
+            return value
+        value = loader()
+        self.set(code, kind, value)
+        return value
+
+    def _claim_refresh(self, key) -> bool:
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _refresh_async(self, code, kind, loader) -> None:
+        key = (code, kind)
+        if not self._claim_refresh(key):
+            return
+
+        async def run():
+            try:
+                self.set(code, kind, await loader())
+            except Exception:
+                pass  # 失敗時は古い値のまま。次のアクセスで再試行される
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _refresh_sync(self, code, kind, loader) -> None:
+        key = (code, kind)
+        if not self._claim_refresh(key):
+            return
+
+        def run():
+            try:
+                self.set(code, kind, loader())
+            except Exception:
+                pass
+            finally:
+                self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
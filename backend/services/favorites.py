@@ -0,0 +1,175 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# お気に入り (ウォッチリスト) の保存先 favorites.json を扱うリポジトリ。
+# Flask の複数ワーカーから同時に使われる前提で、書き込みはファイルロックをかけて原子的に行う。
+
+
+class FavoritesRepository:
+    """favorites.json をメモリに保持し、変更はまとめて書き戻す (write-behind)
+
+    - 読み込みはファイルの mtime / サイズ / inode が変わった時だけ
+    - 書き込みは flush_delay 秒ぶんの変更をまとめ、ロックファイルで排他した上で
+      最新のファイル内容に変更操作を適用し、一時ファイル + rename で原子的に置き換える
+      (他ワーカーの更新を上書きで失わない)
+    - 旧形式 (コードのリスト) も読み込める
+    """
+
+    def __init__(self, path: str, default: Optional[Dict[str, str]] = None, flush_delay: float = 0.5):
+        self.path = path
+        self.default = dict(default or {})
+        self.flush_delay = flush_delay
+        self._data: Dict[str, str] = {}
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._loaded = False
+        self._pending: List[Tuple[str, str, Optional[str]]] = []   # ("set", code, name) / ("del", code, None)
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        atexit.register(self.flush)
+
+    # ---------------------------------------------------------
+    # 読み取り
+    # ---------------------------------------------------------
+    def all(self) -> Dict[str, str]:
+        with self._lock:
+            self._reload_if_changed()
+            return dict(self._data)
+
+    def get(self, code: str, default: str = "") -> str:
+        with self._lock:
+            self._reload_if_changed()
+            return self._data.get(code, default)
+
+    def __contains__(self, code: str) -> bool:
+        with self._lock:
+            self._reload_if_changed()
+            return code in self._data
+
+    # ---------------------------------------------------------
+    # 更新 (メモリへは即時反映、ファイルへは遅延書き込み)
+    # ---------------------------------------------------------
+    def set(self, code: str, name: str) -> None:
+        self.update({code: name})
+
+    def update(self, items: Dict[str, str]) -> None:
+        if not items:
+            return
+        with self._lock:
+            self._reload_if_changed()
+            for code, name in items.items():
+                self._data[code] = name
+                self._pending.append(("set", code, name))
+            self._schedule_flush()
+
+    def remove(self, code: str) -> None:
+        with self._lock:
+            self._reload_if_changed()
+            if code not in self._data:
+                return
+            del self._data[code]
+            self._pending.append(("del", code, None))
+            self._schedule_flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            with self._file_lock():
+                # 他ワーカーが書いた最新内容に、このワーカーの変更だけを適用する
+                data = self._read_file()
+                if data is None:
+                    data = dict(self.default)
+                self._apply(data, self._pending)
+                self._write_file(data)
+                self._pending = []
+                self._data = data
+                self._signature = self._stat()
+
+    # ---------------------------------------------------------
+    # 内部処理
+    # ---------------------------------------------------------
+    def _schedule_flush(self) -> None:
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _reload_if_changed(self) -> None:
+        signature = self._stat()
+        if self._loaded and signature == self._signature:
+            return
+        data = self._read_file()
+        if data is None:
+            data = dict(self.default)
+        # まだ書き出していない自分の変更は読み直した内容の上に載せ直す
+        self._apply(data, self._pending)
+        self._data = data
+        self._signature = signature
+        self._loaded = True
+
+    def _read_file(self) -> Optional[Dict[str, str]]:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            return dict(self.default)
+        if isinstance(data, list):
+            # 旧形式を新形式に変換
+            return {c: "" for c in data}
+        return data
+
+    def _write_file(self, data: Dict[str, str]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=".favorites-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    @staticmethod
+    def _apply(data: Dict[str, str], ops) -> None:
+        for op, code, name in ops:
+            if op == "set":
+                data[code] = name
+            else:
+                data.pop(code, None)
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
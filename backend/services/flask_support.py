@@ -0,0 +1,153 @@
+import re
+import time
+from typing import Callable
+from urllib.parse import urlsplit
+
+import requests
+from flask import Blueprint, Flask, g, render_template, request
+from requests.adapters import HTTPAdapter
+
+# Flask 版 (app.py / app_v2.py) で共通の部品。flask / requests に依存するので FastAPI 側からは import しない。
+
+# 入力チェック用の正規表現は import 時に 1 回だけコンパイルする
+CODE_RE = re.compile(r'^\d{4}$')
+CODE_PREFIX_RE = re.compile(r'^\d{4}\s*')
+CODES_IN_TEXT_RE = re.compile(r'\b(\d{4})\b')
+
+# 名前が空の銘柄がある間にウォッチリストを取り直す回数の上限 (1 秒ごと)。取得できない銘柄があっても止まる
+WATCHLIST_POLL_LIMIT = 60
+
+
+class UpstreamFetcher:
+    """株探への GET をスケジューラー経由で行う (keep-alive のセッション + メトリクス + 再試行)
+
+    接続エラーと 502/503/504 は retries 回まで再試行する。再試行も 1 回ごとにスケジューラーの
+    トークンを取るのでレート制限を超えず、失敗の後にスケジューラーが入れる一時停止が再試行の間隔になる。
+    429 はスケジューラーのバックオフに任せて再試行しない。
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, scheduler, metrics, retries: int = 1, timeout: float = 5.0, pool_size: int = 10):
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "Mozilla/5.0"
+        # 同時に株探へアクセスするスレッドの数だけ接続を保持する (再試行は urllib3 ではなく get で行う)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url: str, kind: str = "other") -> requests.Response:
+        host = urlsplit(url).netloc
+        sampled = self.metrics.sampled()
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            with self.metrics.span("queue", kind, sampled):
+                self.scheduler.acquire_sync(host)
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                self.scheduler.report(host, 0, time.monotonic() - started)
+                self.metrics.upstream(kind, 0)
+                self.metrics.failures.inc("fetch", kind, type(e).__name__)
+                if last:
+                    raise
+                continue
+            elapsed = time.monotonic() - started
+            self.scheduler.report(host, response.status_code, elapsed,
+                                  self.scheduler.retry_after(response.headers))
+            self.metrics.upstream(kind, response.status_code, len(response.content))
+            if sampled:
+                # requests は接続とヘッダー受信を分けられないため、ttfb に接続時間を含む
+                ttfb = response.elapsed.total_seconds()
+                self.metrics.observe("ttfb", kind, ttfb)
+                self.metrics.observe("download", kind, max(elapsed - ttfb, 0.0))
+            if response.status_code in self.RETRY_STATUSES and not last:
+                continue
+            return response
+
+
+def shared_loader(tier, cache) -> Callable:
+    """load(kind, code, loader) を返す。tier があれば他のワーカーの取得結果を使い、
+    同じページの取得は 1 ワーカーだけが行う"""
+    def load(kind, code, loader):
+        if tier is None:
+            return loader()
+        return tier.load_sync(kind, code, loader, cache.ttl_for(kind))
+    return load
+
+
+def install_request_metrics(app: Flask, metrics) -> None:
+    """ルート単位の応答時間・ステータスを metrics に記録する"""
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_sampled = metrics.sampled()
+
+    @app.after_request
+    def _record_request_metrics(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            elapsed = time.perf_counter() - started
+            metrics.response(route, response.status_code, elapsed if g.pop("metrics_sampled", False) else None)
+        return response
+
+
+def watchlist_blueprint(favorites, name_resolver, get_stock_name: Callable[[str], str]) -> Blueprint:
+    """ウォッチリスト (お気に入り) の追加・削除・一括インポートと部分テンプレート"""
+    bp = Blueprint("watchlist", __name__)
+
+    def render_watchlist():
+        favs = favorites.all()
+        # リゾルバーの解決待ちはワーカーごとの状態なので、保存内容 (名前が空の銘柄) から判断する
+        pending = {code for code, name in favs.items() if not name}
+        return render_template("partials/watchlist.html", favorites=favs, pending=pending,
+                               poll=request.args.get("poll", 0, type=int), poll_limit=WATCHLIST_POLL_LIMIT)
+
+    def set_resolved_name(code, name):
+        # 解決待ちの間に削除された銘柄は戻さない
+        if code in favorites:
+            favorites.set(code, name)
+
+    @bp.route("/favorites/add", methods=["POST"])
+    def add_favorite():
+        code = request.form.get("code")
+        if code and CODE_RE.match(code):
+            if code not in favorites:
+                favorites.set(code, get_stock_name(code))
+        return render_watchlist()
+
+    @bp.route("/favorites/remove", methods=["POST"])
+    def remove_favorite():
+        code = request.form.get("code")
+        favorites.remove(code)
+        return render_watchlist()
+
+    @bp.route("/favorites/import", methods=["POST"])
+    def import_favorites():
+        text = request.form.get("text")
+        codes = CODES_IN_TEXT_RE.findall(text)
+        favs = favorites.all()
+        new_codes = [c for c in dict.fromkeys(codes) if c not in favs]
+        # マスター表・キャッシュで分かる銘柄名はすぐ反映し、残りは裏で並列に取得して順次埋める
+        known = {c: name_resolver.lookup(c) or "" for c in new_codes}
+        favorites.update(known)
+        name_resolver.resolve_async([c for c, name in known.items() if not name], set_resolved_name)
+        return render_watchlist()
+
+    @bp.route("/favorites/watchlist")
+    def watchlist_partial():
+        return render_watchlist()
+
+    return bp
+
+
+def warm_templates(app: Flask) -> None:
+    """全テンプレートを事前にコンパイルし、最初の表示でのコンパイル待ちをなくす"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
@@ -0,0 +1,156 @@
+import io
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from schemas.stock import OHLCV
+
+_NON_NUMERIC = re.compile(r"[^\d.\n]")
+
+COLUMNS = ("open", "high", "low", "close", "volume", "vwap")
+
+
+def clean_numbers(cells: Sequence[str]) -> np.ndarray:
+    """表示文字列の列を float 配列に変換する (解釈できないセルは NaN)
+
+    1 セルずつ re.sub せず、列全体を改行で連結して 1 回で数字以外を除去する。
+    空セルは 0 として扱う (従来の clean_num と同じ挙動)。
+    """
+    if not cells:
+        return np.empty(0, dtype=np.float64)
+    raw = [c.replace("\n", "") for c in cells]
+    cleaned = _NON_NUMERIC.sub("", "\n".join(raw)).split("\n")
+    values = ["0" if not r else (c if c else "nan") for r, c in zip(raw, cleaned)]
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        # "1.2.3" のような不正値が混ざっている場合だけ 1 件ずつ解釈する
+        out = np.empty(len(values), dtype=np.float64)
+        for i, v in enumerate(values):
+            try:
+                out[i] = float(v)
+            except ValueError:
+                out[i] = np.nan
+        return out
+
+
+@dataclass
+class HistoryColumns:
+    """日足を列指向 (連続した NumPy 配列) で保持する"""
+
+    date: np.ndarray    # "YYYY-MM-DD" の文字列配列
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray  # int64
+    vwap: np.ndarray
+    # to_models() の結果 (キャッシュ上の同じ履歴から何度も応答するため初回だけ作る)
+    _models: Optional[List[OHLCV]] = field(default=None, init=False, repr=False, compare=False)
+
+    @classmethod
+    def empty(cls) -> "HistoryColumns":
+        f = np.empty(0, dtype=np.float64)
+        return cls(np.empty(0, dtype="U10"), f, f, f, f, np.empty(0, dtype=np.int64), f)
+
+    @classmethod
+    def from_cells(cls, dates: List[str], cells: Dict[str, List[str]]) -> "HistoryColumns":
+        """テーブルから集めたセル文字列を列ごとにまとめて数値化する
+
+        数値化できない値を含む行は捨て、日付の古い順に並べる。
+        VWAP は Typical Price (H+L+C)/3 で推定する。
+        """
+        o = clean_numbers(cells["open"])
+        h = clean_numbers(cells["high"])
+        l = clean_numbers(cells["low"])
+        c = clean_numbers(cells["close"])
+        v = clean_numbers(cells["volume"])
+
+        # 出来高は整数のみ有効 (小数点を含むセルは従来通り不正扱い)
+        volume_int = np.array(["." not in s for s in cells["volume"]], dtype=bool)
+        valid = ~(np.isnan(o) | np.isnan(h) | np.isnan(l) | np.isnan(c) | np.isnan(v)) & volume_int
+
+        date = np.array(dates, dtype=str)[valid]
+        order = np.argsort(date, kind="stable")
+        o, h, l, c = o[valid][order], h[valid][order], l[valid][order], c[valid][order]
+        return cls(
+            date=date[order],
+            open=o,
+            high=h,
+            low=l,
+            close=c,
+            volume=v[valid][order].astype(np.int64),
+            vwap=np.round((h + l + c) / 3, 2),
+        )
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, list]) -> "HistoryColumns":
+        """列の dict (HistoryStore.load の戻り値など) から組み立てる"""
+        f = lambda name: np.array(columns[name], dtype=np.float64)
+        vwap = np.array([np.nan if w is None else w for w in columns["vwap"]], dtype=np.float64)
+        return cls(
+            date=np.array(columns["date"], dtype="U10"),
+            open=f("open"),
+            high=f("high"),
+            low=f("low"),
+            close=f("close"),
+            volume=np.array(columns["volume"], dtype=np.int64),
+            vwap=vwap,
+        )
+
+    def __len__(self) -> int:
+        return len(self.date)
+
+    def tail(self, n: int) -> "HistoryColumns":
+        return HistoryColumns(**{name: getattr(self, name)[-n:] if n > 0 else getattr(self, name)[:0]
+                                 for name in ("date",) + COLUMNS})
+
+    def range_slice(self, start: Optional[str] = None, end: Optional[str] = None) -> slice:
+        """日付 [start, end] に当たる添字範囲 (date は昇順前提)"""
+        lo = int(np.searchsorted(self.date, start, side="left")) if start else 0
+        hi = int(np.searchsorted(self.date, end, side="right")) if end else len(self.date)
+        return slice(lo, hi)
+
+    def between(self, start: Optional[str] = None, end: Optional[str] = None) -> "HistoryColumns":
+        """日付 [start, end] の範囲を切り出す"""
+        window = self.range_slice(start, end)
+        return HistoryColumns(**{name: getattr(self, name)[window] for name in ("date",) + COLUMNS})
+
+    # ---------------------------------------------------------
+    # 出力形式
+    # ---------------------------------------------------------
+    def to_models(self) -> List[OHLCV]:
+        if self._models is None:
+            cols = self.to_columns()
+            self._models = [
+                OHLCV(date=d, open=o, high=h, low=l, close=c, volume=v, vwap=None if w != w else w)
+                for d, o, h, l, c, v, w in zip(cols["date"], cols["open"], cols["high"], cols["low"],
+                                               cols["close"], cols["volume"], cols["vwap"])
+            ]
+        return list(self._models)
+
+    # extra には同じ長さの追加列 (テクニカル指標など) を渡せる
+    def to_columns(self, extra: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, list]:
+        columns = {"date": self.date.tolist(), **{name: getattr(self, name).tolist() for name in COLUMNS}}
+        for name, values in (extra or {}).items():
+            # JSON には NaN を出せないので null にする
+            columns[name] = [None if v != v else v for v in values.tolist()]
+        return columns
+
+    def to_npz(self, extra: Optional[Dict[str, np.ndarray]] = None) -> bytes:
+        buf = io.BytesIO()
+        np.savez(buf, date=self.date.astype("U10"), **{name: getattr(self, name) for name in COLUMNS}, **(extra or {}))
+        return buf.getvalue()
+
+    def to_arrow(self, extra: Optional[Dict[str, np.ndarray]] = None) -> bytes:
+        """Arrow IPC stream 形式。pyarrow は任意依存 (未インストールなら ImportError)"""
+        import pyarrow as pa
+
+        table = pa.table({"date": self.date.tolist(), **{name: getattr(self, name) for name in COLUMNS}, **(extra or {})})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
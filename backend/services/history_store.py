@@ -0,0 +1,141 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+# 日足のローカル永続化 (SQLite)。
+# source で取得元 (kabutan / yfinance) を分けて保持する。
+
+BAR_COLUMNS = ("date", "open", "high", "low", "close", "volume", "vwap")
+
+# 取り直した確定済みの足が保存済みの値とこれ以上ずれていたら、分割・配当で過去分が調整し直されたと見なす
+REBASE_TOLERANCE = 1e-4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    source TEXT NOT NULL,
+    code TEXT NOT NULL,
+    date TEXT NOT NULL,
+    open REAL, high REAL, low REAL, close REAL,
+    volume INTEGER,
+    vwap REAL,
+    PRIMARY KEY (source, code, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sync (
+    source TEXT NOT NULL,
+    code TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (source, code)
+) WITHOUT ROWID;
+"""
+
+
+class HistoryStore:
+    """銘柄ごとの日足を SQLite に蓄積し、差分だけを追記する"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 の接続はスレッドごとに持つ
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def last_date(self, source: str, code: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT MAX(date) FROM bars WHERE source = ? AND code = ?", (source, code)
+        ).fetchone()
+        return row[0] if row else None
+
+    def sync_start(self, source: str, code: str) -> Optional[str]:
+        """差分取得の開始日。最終日の 1 つ前 (確定済みの足) から取り直し、matches で照合できるようにする"""
+        rows = self._connect().execute(
+            "SELECT date FROM bars WHERE source = ? AND code = ? ORDER BY date DESC LIMIT 2", (source, code)
+        ).fetchall()
+        return rows[-1][0] if rows else None
+
+    def matches(self, source: str, code: str, bars: Dict[str, List]) -> bool:
+        """取り直した足のうち保存済みの確定足 (最終日より前) が保存値と一致するか
+
+        一致しなければ分割・配当で過去分の価格の基準が変わっているので、delete して全期間を取り直す。
+        最終日は場中に変わるので照合しない。値の欠けた足も照合しない。
+        """
+        last = self.last_date(source, code)
+        fetched = {d: (o, h, l, c) for d, o, h, l, c in zip(bars["date"], bars["open"], bars["high"],
+                                                               bars["low"], bars["close"])
+                   if last is not None and d < last}
+        if not fetched:
+            return True
+        placeholders = ",".join("?" * len(fetched))
+        stored = self._connect().execute(
+            f"SELECT date, open, high, low, close FROM bars WHERE source = ? AND code = ? AND date IN ({placeholders})",
+            (source, code, *fetched),
+        ).fetchall()
+        return all(
+            old is None or new is None or new != new or math.isclose(float(new), old, rel_tol=REBASE_TOLERANCE)
+            for d, *values in stored
+            for new, old in zip(fetched[d], values)
+        )
+
+    def delete(self, source: str, code: str) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM bars WHERE source = ? AND code = ?", (source, code))
+            conn.execute("DELETE FROM sync WHERE source = ? AND code = ?", (source, code))
+
+    def synced_at(self, source: str, code: str) -> Optional[float]:
+        row = self._connect().execute(
+            "SELECT synced_at FROM sync WHERE source = ? AND code = ?", (source, code)
+        ).fetchone()
+        return row[0] if row else None
+
+    def is_fresh(self, source: str, code: str, max_age: float) -> bool:
+        synced = self.synced_at(source, code)
+        return synced is not None and time.time() - synced < max_age
+
+    def merge(self, source: str, code: str, bars: Dict[str, List]) -> int:
+        """最終保存日以降の足だけを書き込む (最終日は場中に変わるので上書き)
+
+        bars は BAR_COLUMNS をキーにした列の dict。書き込んだ行数を返す。
+        """
+        last = self.last_date(source, code)
+        dates = bars["date"]
+        vwaps = bars.get("vwap") or [None] * len(dates)
+        rows = [
+            (source, code, d, float(o), float(h), float(l), float(c), int(v), None if w is None else float(w))
+            for d, o, h, l, c, v, w in zip(dates, bars["open"], bars["high"], bars["low"],
+                                           bars["close"], bars["volume"], vwaps)
+            if last is None or d >= last
+        ]
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT OR REPLACE INTO sync VALUES (?, ?, ?)", (source, code, time.time()))
+        return len(rows)
+
+    def load(self, source: str, code: str, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, List]:
+        """[start, end] の足を日付昇順・列指向で返す"""
+        sql = "SELECT date, open, high, low, close, volume, vwap FROM bars WHERE source = ? AND code = ?"
+        params: list = [source, code]
+        if start:
+            sql += " AND date >= ?"
+            params.append(start)
+        if end:
+            sql += " AND date <= ?"
+            params.append(end)
+        rows = self._connect().execute(sql + " ORDER BY date", params).fetchall()
+        columns = list(zip(*rows)) if rows else [()] * len(BAR_COLUMNS)
+        return {name: list(values) for name, values in zip(BAR_COLUMNS, columns)}
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from core.config import Settings, settings
+from services.metrics import PipelineMetrics
+from services.scheduler import UpstreamScheduler
+from services.shared_store import open_shared_store
+from services.telemetry import metrics as default_metrics
+
+
+class UpstreamClient:
+    """アプリ全体で共有する上流 (株探) 向け HTTP クライアント
+
+    keep-alive / HTTP/2 のコネクションプールを 1 つだけ持ち、
+    FastAPI の lifespan で start() / close() される。
+    """
+
+    HEADERS = {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
+    }
+
+    def __init__(self, config: Settings = settings, metrics: PipelineMetrics = default_metrics, shared=None):
+        self.config = config
+        self.metrics = metrics
+        # すべての上流アクセスはスケジューラーでレート制御する
+        self.scheduler = UpstreamScheduler(
+            rate=config.upstream_rate,
+            burst=config.upstream_burst,
+            host_rate=config.upstream_host_rate,
+            host_burst=config.upstream_host_burst,
+            slow_threshold=config.upstream_slow_threshold,
+            # 複数ワーカー時は全ワーカー合計でレートを守る
+            shared=shared,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.requests = 0
+        self.connections_opened = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        if self._client is not None:
+            return
+        cfg = self.config
+        self._client = httpx.AsyncClient(
+            headers=self.HEADERS,
+            http2=cfg.http2,
+            limits=httpx.Limits(
+                max_connections=cfg.http_max_connections,
+                max_keepalive_connections=cfg.http_max_keepalive_connections,
+                keepalive_expiry=cfg.http_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                cfg.http_read_timeout,
+                connect=cfg.http_connect_timeout,
+                pool=cfg.http_pool_timeout,
+            ),
+        )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get(self, url: str, kind: str = "other") -> httpx.Response:
+        """kind はメトリクス用のページ種別 (quote / news / history)"""
+        # lifespan 外 (スクリプト等) から呼ばれた場合は遅延生成
+        if self._client is None:
+            await self.start()
+        host = urlsplit(url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.config.http_max_connections_per_host)
+        sampled = self.metrics.sampled()
+        with self.metrics.span("queue", kind, sampled):
+            await self.scheduler.acquire(host)
+        events: Dict[str, float] = {}
+        async with limit:
+            self.requests += 1
+            started = time.monotonic()
+            try:
+                response = await self._client.get(url, extensions={"trace": self._tracer(events, sampled)})
+            except httpx.HTTPError as e:
+                self.errors += 1
+                self.scheduler.report(host, 0, time.monotonic() - started)
+                self.metrics.upstream(kind, 0)
+                self.metrics.failures.inc("fetch", kind, type(e).__name__)
+                raise
+        self.scheduler.report(host, response.status_code, time.monotonic() - started,
+                              self.scheduler.retry_after(response.headers))
+        self.metrics.upstream(kind, response.status_code, len(response.content))
+        if sampled:
+            self._observe_phases(kind, events)
+        return response
+
+    def _tracer(self, events: Dict[str, float], sampled: bool):
+        async def trace(event_name: str, info: dict) -> None:
+            # 新規 TCP 接続が張られた時だけ発火する。それ以外はプールの再利用
+            if event_name == "connection.connect_tcp.started":
+                self.connections_opened += 1
+            if sampled:
+                # http11.* / http2.* の接頭辞を外して記録する
+                name = event_name.split(".", 1)[1] if event_name.startswith("http") else event_name
+                events[name] = time.perf_counter()
+        return trace
+
+    def _observe_phases(self, kind: str, events: Dict[str, float]) -> None:
+        """trace の時刻から connect (TCP + TLS) / ttfb (送信〜ヘッダー受信) / download (本文) を記録"""
+        phases = (
+            ("connect", "connection.connect_tcp.started",
+             "connection.start_tls.complete" if "connection.start_tls.complete" in events else "connection.connect_tcp.complete"),
+            ("ttfb", "send_request_headers.started", "receive_response_headers.complete"),
+            ("download", "receive_response_body.started", "receive_response_body.complete"),
+        )
+        for stage, start, end in phases:
+            if start in events and end in events:
+                self.metrics.observe(stage, kind, events[end] - events[start])
+
+    def stats(self) -> dict:
+        reused = max(self.requests - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+            "errors": self.errors,
+            "http2": self.config.http2,
+        }
+
+
+# 複数ワーカーで共有するストア (空文字なら共有しない)
+shared_store = open_shared_store(settings.shared_store_url)
+upstream = UpstreamClient(shared=shared_store)
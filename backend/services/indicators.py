@@ -0,0 +1,84 @@
+from typing import Callable, Dict, Iterable
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from services.history import HistoryColumns
+
+# 日足の列配列からテクニカル指標を計算する。
+# 窓が揃わない先頭区間は NaN (JSON では null) になる。
+
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    """単純移動平均 (累積和の差分で O(n))"""
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        csum = np.cumsum(np.insert(values.astype(np.float64), 0, 0.0))
+        out[window - 1:] = (csum[window:] - csum[:-window]) / window
+    return out
+
+
+def deviation(close: np.ndarray, average: np.ndarray) -> np.ndarray:
+    """移動平均乖離率 (%)"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (close / average - 1.0) * 100.0
+
+
+def cumulative_vwap(history: HistoryColumns) -> np.ndarray:
+    """期間先頭からの出来高加重平均 (Typical Price ベース)"""
+    typical = (history.high + history.low + history.close) / 3.0
+    volume = history.volume.astype(np.float64)
+    cum_volume = np.cumsum(volume)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(cum_volume > 0, np.cumsum(typical * volume) / cum_volume, np.nan)
+
+
+def rsi(close: np.ndarray, window: int = 14) -> np.ndarray:
+    """RSI (値上がり幅・値下がり幅の単純平均による Cutler 方式)"""
+    out = np.full(len(close), np.nan)
+    if len(close) <= window:
+        return out
+    diff = np.diff(close.astype(np.float64))
+    gains = sliding_window_view(np.clip(diff, 0, None), window).sum(axis=1)
+    losses = sliding_window_view(np.clip(-diff, 0, None), window).sum(axis=1)
+    total = gains + losses
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[window:] = np.where(total > 0, gains / total * 100.0, 50.0)
+    return out
+
+
+def bollinger(close: np.ndarray, window: int = 20, k: float = 2.0):
+    """ボリンジャーバンド (中心線, +kσ, -kσ)。σ は母標準偏差"""
+    middle = np.full(len(close), np.nan)
+    sigma = np.full(len(close), np.nan)
+    if len(close) >= window:
+        windows = sliding_window_view(close.astype(np.float64), window)
+        middle[window - 1:] = windows.mean(axis=1)
+        sigma[window - 1:] = windows.std(axis=1)
+    return middle, middle + k * sigma, middle - k * sigma
+
+
+def _bollinger_part(index: int) -> Callable[[HistoryColumns], np.ndarray]:
+    return lambda h: bollinger(h.close)[index]
+
+
+INDICATORS: Dict[str, Callable[[HistoryColumns], np.ndarray]] = {
+    "ma5": lambda h: sma(h.close, 5),
+    "ma25": lambda h: sma(h.close, 25),
+    "ma75": lambda h: sma(h.close, 75),
+    "ma5_diff": lambda h: deviation(h.close, sma(h.close, 5)),
+    "ma25_diff": lambda h: deviation(h.close, sma(h.close, 25)),
+    "ma75_diff": lambda h: deviation(h.close, sma(h.close, 75)),
+    "cum_vwap": cumulative_vwap,
+    "rsi14": lambda h: rsi(h.close, 14),
+    "bb_middle": _bollinger_part(0),
+    "bb_upper": _bollinger_part(1),
+    "bb_lower": _bollinger_part(2),
+}
+
+
+def compute(history: HistoryColumns, names: Iterable[str]) -> Dict[str, np.ndarray]:
+    unknown = [n for n in names if n not in INDICATORS]
+    if unknown:
+        raise ValueError(f"Unknown indicators: {', '.join(unknown)}")
+    return {name: np.round(INDICATORS[name](history), 4) for name in names}
@@ -1,216 +1,235 @@
-import httpx
-from bs4 import BeautifulSoup
-import re
-from typing import List, Optional
+import asyncio
+from typing import Dict, Iterable, List, Optional, Set
+import numpy as np
+from core.config import settings
 from schemas.stock import StockDetails, NewsItem, OHLCV
+from services.cache import ResponseCache
+from services import indicators, kabutan_parser
+from services.history import HistoryColumns
+from services.history_store import HistoryStore
+from services.http_client import UpstreamClient, shared_store, upstream
+from services.market_calendar import MarketCalendar
+from services.parse_pool import ParsePool
+from services.parsing import resolve_parser
+from services.shared_store import SharedTier
+from services.singleflight import SingleFlight
+from services.snapshot import SnapshotTable
+from services.telemetry import metrics
 
 class KabutanService:
-    BASE_URL = "https://kabutan.jp"
-    HEADERS = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
-    }
+    BASE_URL = settings.kabutan_base_url
 
-    async def get_stock_details(self, code: str) -> StockDetails:
-        url = f"{self.BASE_URL}/stock/?code={code}"
-        async with httpx.AsyncClient(headers=self.HEADERS, timeout=10.0) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                return StockDetails(code=code, name="Error")
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 基本情報
-            name = ""
-            company_block = soup.find('div', class_='company_block')
-            if company_block and company_block.find('h3'):
-                name = re.sub(r'^\d{4}\s*', '', company_block.find('h3').get_text(strip=True))
-
-            # 株価情報 (Selectors refined)
-            current_price = ""
-            change = ""
-            change_percent = ""
-            
-            kabuka_span = soup.select_one(".kabuka")
-            if kabuka_span:
-                current_price = kabuka_span.get_text(strip=True)
-            
-            # 前日比の抽出
-            si_dl1 = soup.select_one(".si_i1_dl1")
-            if si_dl1:
-                dds = si_dl1.find_all('dd')
-                if len(dds) >= 2:
-                    change = dds[0].get_text(strip=True)
-                    change_percent = dds[1].get_text(strip=True).replace("%", "")
-
-            # 詳細指標を抽出する関数
-            def get_val(label):
-                headers = soup.find_all(['th', 'td'])
-                for cell in headers:
-                    cell_text = cell.get_text(strip=True)
-                    if label == cell_text or (label in cell_text and len(cell_text) < 20):
-                        # Case 1: Horizontal header in a <thead> or <tr> with <td> below
-                        table = cell.find_parent('table')
-                        if table:
-                            row = cell.find_parent('tr')
-                            if row:
-                                siblings = row.find_all(['th', 'td'])
-                                idx = siblings.index(cell)
-                                # Check if it's a vertical or horizontal table
-                                # If it's a header row and there's a tbody with data
-                                tbody = table.find('tbody')
-                                if tbody and tbody != row.parent:
-                                    trs = tbody.find_all('tr')
-                                    if trs:
-                                        target_tds = trs[0].find_all('td')
-                                        if len(target_tds) > idx:
-                                            return target_tds[idx].get_text(strip=True)
-                        
-                        # Case 2: Vertical header (th -> td)
-                        td = cell.find_next_sibling('td')
-                        if td:
-                            return td.get_text(strip=True)
-                return "-"
-
-            # 指標情報
-            vwap = get_val("VWAP")
-            volume = get_val("出来高")
-            
-            # ... (margin logic remains same)
-            # 信用取引情報の抽出 (Table based)
-            margin_buy = "-"
-            margin_sell = "-"
-            margin_ratio = "-"
-            
-            shinyo_h2 = soup.find('h2', string=re.compile("信用取引"))
-            if shinyo_h2:
-                shinyo_table = shinyo_h2.find_next('table')
-                if shinyo_table:
-                    tbody = shinyo_table.find('tbody')
-                    if tbody:
-                        first_row = tbody.find('tr')
-                        if first_row:
-                            td_cells = first_row.find_all('td')
-                            if len(td_cells) >= 3:
-                                margin_sell = td_cells[0].get_text(strip=True)
-                                margin_buy = td_cells[1].get_text(strip=True)
-                                margin_ratio = td_cells[2].get_text(strip=True)
-
-            # 乖離率の抽出
-            ma25_diff = "-"
-            ma75_diff = "-"
-            trend_div = soup.select_one(".kabuka_trend")
-            if trend_div:
-                rows = trend_div.find_all('tr')
-                if len(rows) >= 2:
-                    # ヘッダー行に「25日」「75日」が含まれているか確認
-                    header_tds = rows[0].find_all(['th', 'td'])
-                    val_tds = rows[1].find_all(['th', 'td'])
-                    for i, h in enumerate(header_tds):
-                        if "25日" in h.get_text():
-                            if len(val_tds) > i:
-                                ma25_diff = val_tds[i].get_text(strip=True)
-                        if "75日" in h.get_text():
-                            if len(val_tds) > i:
-                                ma75_diff = val_tds[i].get_text(strip=True)
-
-            yield_val = get_val("利回り")
-            settlement = get_val("決算発表日")
-
-            # 同時並行でニュースと履歴を取得
-            news = await self.get_news(code)
-            history = await self.get_history(code)
-
-            details = StockDetails(
-                code=code,
-                name=name,
-                current_price=current_price,
-                change=change,
-                change_percent=change_percent,
-                vwap=vwap,
-                volume=volume,
-                margin_buy=margin_buy,
-                margin_sell=margin_sell,
-                margin_ratio=margin_ratio,
-                ma25_diff=ma25_diff,
-                ma75_diff=ma75_diff,
-                dividend_yield=yield_val,
-                settlement_date=settlement,
-                news=news,
-                history=history
+    def __init__(self, client: UpstreamClient = upstream, cache: Optional[ResponseCache] = None,
+                 calendar: Optional[MarketCalendar] = None, shared: Optional[SharedTier] = None):
+        # 接続プールはアプリ全体で共有する (lifespan で開閉)
+        self.client = client
+        self.parser = resolve_parser(settings.html_parser)
+        # パースはイベントループをブロックしないようワーカーで実行する (lifespan で開閉)
+        self.parse_pool = ParsePool(settings.parse_executor, settings.parse_workers)
+        if cache is None:
+            cache = ResponseCache(
+                ttls={
+                    "quote": settings.cache_ttl_quote,
+                    "news": settings.cache_ttl_news,
+                    "history": settings.cache_ttl_history,
+                    "indicators": settings.cache_ttl_history,
+                },
+                max_stale=settings.cache_max_stale,
+                max_entries=settings.cache_max_entries,
+                max_bytes=settings.cache_max_bytes,
+                # 取引時間外は株価・履歴が変わらないので、次の寄り付きまで保持する
+                ttl_policy=calendar.ttl if calendar is not None else None,
             )
-            return details
+        self.cache = cache
+        # 同じ銘柄・ページへの同時リクエストは上流への 1 回の取得とパースを共有する
+        self.flight = SingleFlight()
+        # 複数ワーカー間でも取得結果を共有し、同じページの取得は 1 プロセスだけが行う
+        if shared is None and shared_store is not None:
+            shared = SharedTier(shared_store, lock_ttl=settings.shared_lock_ttl, wait_timeout=settings.details_timeout)
+        self.shared = shared
+        # 日足のローカル永続化 (空文字なら無効)
+        self.store = HistoryStore(settings.history_store_path) if settings.history_store_path else None
+        # 取得した銘柄の数値指標 (スクリーニング用)
+        self.snapshot = SnapshotTable(max_rows=settings.screen_max_rows)
+
+    # ページ種別 (quote=詳細ページ)。StockDetails のフィールドはいずれかのページから得られる
+    PARTS = ("quote", "news", "history")
+
+    @staticmethod
+    def parts_for(fields: Iterable[str]) -> Set[str]:
+        """要求フィールドの取得に必要なページだけを返す"""
+        parts = set()
+        for field in fields:
+            if field in ("news", "history"):
+                parts.add(field)
+            elif field not in ("code", "degraded"):
+                parts.add("quote")
+        return parts
+
+    async def get_stock_details(self, code: str, parts: Iterable[str] = PARTS,
+                                history_days: Optional[int] = None) -> StockDetails:
+        """history_days を指定すると履歴は直近その日数分だけをモデル化する (0 なら取得しない)"""
+        # 必要なページを同時に取得し、届いた順にパースする
+        parts = set(parts)
+        if history_days == 0:
+            parts.discard("history")
+        loaders = {
+            "quote": (self._fetch_details, settings.details_timeout),
+            "news": (self.get_news, settings.news_timeout),
+            "history": (lambda c: self.get_history(c, history_days), settings.history_timeout),
+        }
+        tasks = {
+            part: asyncio.create_task(self._with_timeout(loader(code), timeout))
+            for part, (loader, timeout) in loaders.items() if part in parts
+        }
+
+        fields = {"name": ""}
+        if "quote" in tasks:
+            try:
+                quote = await tasks["quote"]
+            except BaseException:
+                for task in tasks.values():
+                    task.cancel()
+                raise
+            if quote is None:
+                for task in tasks.values():
+                    task.cancel()
+                metrics.failures.inc("fetch", "quote", "NotFound")
+                return StockDetails(code=code, name="Error")
+            # キャッシュ上の dict を書き換えないようコピーする
+            fields = dict(quote)
+
+        # ニュース・履歴は失敗しても詳細だけで応答する (degraded に記録)
+        degraded = []
+        for part in ("news", "history"):
+            if part not in tasks:
+                continue
+            try:
+                fields[part] = await tasks[part]
+            except Exception as e:
+                metrics.failures.inc("fetch", part, type(e).__name__)
+                degraded.append(part)
+
+        with metrics.span("validate", "details"):
+            return StockDetails(code=code, degraded=degraded, **fields)
+
+    @staticmethod
+    async def _with_timeout(coro, timeout: float):
+        return await asyncio.wait_for(coro, timeout=timeout)
+
+    async def _cached(self, code: str, kind: str, loader):
+        # キャッシュ → in-flight 共有 → (ワーカー間の共有キャッシュ・ロック) → 上流取得 の順に解決する
+        return await self.cache.get_or_fetch(
+            code, kind, lambda: self.flight.do((code, kind), lambda: self._load(code, kind, loader)))
+
+    async def _load(self, code: str, kind: str, loader, max_age: Optional[float] = None):
+        if self.shared is None:
+            value = await loader(code)
+        else:
+            value = await self.shared.load(kind, code, lambda: loader(code), self.cache.ttl_for(kind), max_age)
+        if kind == "quote" and value is not None:
+            # 表示文字列の数値化は取得ごとに 1 回だけ行い、スナップショットに保持する
+            with metrics.span("snapshot", "quote"):
+                self.snapshot.upsert(code, value)
+        return value
+
+    async def _refresh(self, code: str, kind: str, loader, max_age: float = 0.0):
+        # キャッシュを介さず取り直してキャッシュを更新する (失敗時は古い値を残す)
+        # max_age 秒以内に他のワーカーが取り直した値があればそれを使う
+        value = await self.flight.do((code, kind), lambda: self._load(code, kind, loader, max_age))
+        self.cache.set(code, kind, value)
+        return value
+
+    async def get_quote(self, code: str) -> Optional[dict]:
+        """詳細ページの dict をキャッシュ経由で返す"""
+        return await self._fetch_details(code)
+
+    async def refresh_quote(self, code: str, max_age: float = 0.0) -> Optional[dict]:
+        """キャッシュを介さず詳細ページを取り直し、キャッシュも更新する (ライブ配信・定期更新用)"""
+        return await self._refresh(code, "quote", self._load_details, max_age)
+
+    async def warm(self, code: str, max_age: float = 0.0) -> bool:
+        """寄り付き前の先読み: 詳細・ニュース・履歴 (と指標) を取り直してキャッシュに載せる"""
+        if await self.refresh_quote(code, max_age) is None:
+            return False
+        await asyncio.gather(self._refresh(code, "news", self._load_news, max_age),
+                             self._refresh(code, "history", self._load_history, max_age))
+        await self.get_indicators(code, ())
+        return True
+
+    async def _fetch_details(self, code: str) -> Optional[dict]:
+        return await self._cached(code, "quote", self._load_details)
+
+    async def _load_details(self, code: str) -> Optional[dict]:
+        url = f"{self.BASE_URL}/stock/?code={code}"
+        response = await self.client.get(url, kind="quote")
+        if response.status_code != 200:
+            return None
+        # パースはイベントループ外 (ワーカー) で行い、取得した bytes をそのまま渡す
+        with metrics.span("parse", "quote"):
+            return await self.parse_pool.run(
+                kabutan_parser.parse_page, "details", response.content, response.encoding, self.parser)
 
     async def get_news(self, code: str) -> List[NewsItem]:
+        return await self._cached(code, "news", self._load_news) or []
+
+    async def _load_news(self, code: str) -> Optional[List[NewsItem]]:
         url = f"{self.BASE_URL}/stock/news?code={code}"
-        async with httpx.AsyncClient(headers=self.HEADERS, timeout=10.0) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                return []
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            news_items = []
-            table = soup.find('table', class_='s_news_list')
-            if table:
-                for row in table.find_all('tr')[:15]:
-                    link = row.find('a')
-                    if link:
-                        title = link.get_text(strip=True)
-                        href = link.get('href')
-                        if not href.startswith('http'):
-                            href = f"{self.BASE_URL}{href}"
-                        news_items.append(NewsItem(title=title, url=href))
-            return news_items
-
-    async def get_history(self, code: str) -> List[OHLCV]:
+        response = await self.client.get(url, kind="news")
+        if response.status_code != 200:
+            return None
+        with metrics.span("parse", "news"):
+            items = await self.parse_pool.run(
+                kabutan_parser.parse_page, "news", response.content, response.encoding, self.parser, self.BASE_URL)
+        with metrics.span("validate", "news"):
+            return [NewsItem(**item) for item in items]
+
+    async def get_history(self, code: str, days: Optional[int] = None) -> List[OHLCV]:
+        history = await self.get_history_columns(code)
+        if days is not None:
+            history = history.tail(days)
+        with metrics.span("validate", "history"):
+            return history.to_models()
+
+    async def get_history_columns(self, code: str) -> HistoryColumns:
+        return await self._cached(code, "history", self._load_history) or HistoryColumns.empty()
+
+    async def get_indicators(self, code: str, names: Iterable[str]) -> Dict[str, np.ndarray]:
+        """履歴全体に対するテクニカル指標 (各配列は get_history_columns と同じ長さ)"""
+        history = await self.get_history_columns(code)
+        last_bar = history.date[-1] if len(history) else ""
+
+        # 最終足が変わるまでは同じ結果なので、全指標をまとめて 1 回だけ計算する
+        async def compute_all():
+            return indicators.compute(history, indicators.INDICATORS)
+
+        values = await self.cache.get_or_fetch((code, last_bar), "indicators", compute_all)
+        return {name: values[name] for name in names}
+
+    async def _load_history(self, code: str) -> Optional[HistoryColumns]:
+        if self.store is None:
+            return await self._scrape_history(code)
+
+        # 直近に同期済みならローカルの蓄積分だけで応答する
+        if await asyncio.to_thread(self.store.is_fresh, "kabutan", code, settings.history_sync_interval):
+            return HistoryColumns.from_columns(await asyncio.to_thread(self.store.load, "kabutan", code))
+
+        # 株探の最新ページを取得し、最終保存日以降の足だけを追記する
+        latest = await self._scrape_history(code)
+        if latest is None:
+            return None
+        columns = latest.to_columns()
+        if not await asyncio.to_thread(self.store.matches, "kabutan", code, columns):
+            # 株探の時系列も分割調整済みなので、分割後は過去の足の基準が変わる。蓄積分を捨ててページの足で置き直す
+            await asyncio.to_thread(self.store.delete, "kabutan", code)
+        await asyncio.to_thread(self.store.merge, "kabutan", code, columns)
+        return HistoryColumns.from_columns(await asyncio.to_thread(self.store.load, "kabutan", code))
+
+    async def _scrape_history(self, code: str) -> Optional[HistoryColumns]:
         url = f"{self.BASE_URL}/stock/kabuka?code={code}"
-        async with httpx.AsyncClient(headers=self.HEADERS, timeout=10.0) as client:
-            response = await client.get(url)
-            if response.status_code != 200:
-                return []
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            history = []
-
-            def clean_num(s):
-                if not s: return 0
-                return re.sub(r'[^\d.]', '', s)
-
-            # 履歴テーブル (日付, 始値, 高値, 安値, 終値, 前日比, 騰落率, 売買高)
-            tables = soup.select("table.stock_kabuka0, table.stock_kabuka_dwm")
-            for table in tables:
-                tbody = table.find('tbody')
-                if not tbody: continue
-                rows = tbody.find_all('tr')
-                for row in rows:
-                    tds = row.find_all(['th', 'td'])
-                    if len(tds) >= 8:
-                        # 日付はthのtimeタグ
-                        date_tag = tds[0].find('time')
-                        date_str = date_tag.get('datetime') if date_tag else tds[0].get_text(strip=True)
-                        
-                        try:
-                            o = float(clean_num(tds[1].get_text(strip=True)))
-                            h = float(clean_num(tds[2].get_text(strip=True)))
-                            l = float(clean_num(tds[3].get_text(strip=True)))
-                            c = float(clean_num(tds[4].get_text(strip=True)))
-                            v = int(clean_num(tds[7].get_text(strip=True)))
-                            
-                            # VWAPの推定 (Typical Price: (H+L+C)/3)
-                            est_vwap = round((h + l + c) / 3, 2)
-                            
-                            item = OHLCV(
-                                date=date_str,
-                                open=o,
-                                high=h,
-                                low=l,
-                                close=c,
-                                volume=v,
-                                vwap=est_vwap
-                            )
-                            history.append(item)
-                        except (ValueError, TypeError):
-                            continue
-            
-            # 日付順にソート（古い順）
-            history.sort(key=lambda x: x.date)
-            return history
+        response = await self.client.get(url, kind="history")
+        if response.status_code != 200:
+            return None
+        with metrics.span("parse", "history"):
+            return await self.parse_pool.run(
+                kabutan_parser.parse_page, "history", response.content, response.encoding, self.parser)
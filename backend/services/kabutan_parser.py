@@ -0,0 +1,168 @@
+import re
+from typing import List, Optional
+
+import soupsieve as sv
+
+from services.history import HistoryColumns
+from services.parsing import HISTORY_SCOPE, NEWS_SCOPE, LabelIndex, make_detail_soup, make_soup
+
+# 株探ページのパース処理。ワーカープロセスからも呼べるよう、
+# 引数・戻り値が pickle 可能なモジュール関数として定義する。
+
+# 正規表現・CSS セレクタは呼び出しごとに組み立てず、import 時に 1 回だけコンパイルする
+_CODE_PREFIX_RE = re.compile(r'^\d{4}\s*')
+_MARGIN_HEADING_RE = re.compile("信用取引")
+_KABUKA = sv.compile(".kabuka")
+_CHANGE_DL = sv.compile(".si_i1_dl1")
+_TREND_DIV = sv.compile(".kabuka_trend")
+_HISTORY_TABLES = sv.compile("table.stock_kabuka0, table.stock_kabuka_dwm")
+
+
+def parse_page(kind: str, content: bytes, encoding: Optional[str], parser: str, *args):
+    """ワーカー側の入口: bytes をデコードして kind 別のパーサーに渡す"""
+    html = content.decode(encoding or "utf-8", errors="replace")
+    return PARSERS[kind](html, parser, *args)
+
+
+def parse_details(html: str, parser: str) -> dict:
+    """詳細ページから株価・指標を抽出する"""
+    soup = make_detail_soup(html, parser)
+    
+    # 基本情報
+    name = ""
+    company_block = soup.find('div', class_='company_block')
+    if company_block and company_block.find('h3'):
+        name = _CODE_PREFIX_RE.sub('', company_block.find('h3').get_text(strip=True))
+
+    # 株価情報 (Selectors refined)
+    current_price = ""
+    change = ""
+    change_percent = ""
+    
+    kabuka_span = _KABUKA.select_one(soup)
+    if kabuka_span:
+        current_price = kabuka_span.get_text(strip=True)
+    
+    # 前日比の抽出
+    si_dl1 = _CHANGE_DL.select_one(soup)
+    if si_dl1:
+        dds = si_dl1.find_all('dd')
+        if len(dds) >= 2:
+            change = dds[0].get_text(strip=True)
+            change_percent = dds[1].get_text(strip=True).replace("%", "")
+
+    # 詳細指標 (見出しセル → 値) を 1 回の走査で索引化する
+    labels = LabelIndex(soup)
+
+    # 指標情報
+    vwap = labels.get("VWAP")
+    volume = labels.get("出来高")
+    
+    # ... (margin logic remains same)
+    # 信用取引情報の抽出 (Table based)
+    margin_buy = "-"
+    margin_sell = "-"
+    margin_ratio = "-"
+    
+    shinyo_h2 = soup.find('h2', string=_MARGIN_HEADING_RE)
+    if shinyo_h2:
+        shinyo_table = shinyo_h2.find_next('table')
+        if shinyo_table:
+            tbody = shinyo_table.find('tbody')
+            if tbody:
+                first_row = tbody.find('tr')
+                if first_row:
+                    td_cells = first_row.find_all('td')
+                    if len(td_cells) >= 3:
+                        margin_sell = td_cells[0].get_text(strip=True)
+                        margin_buy = td_cells[1].get_text(strip=True)
+                        margin_ratio = td_cells[2].get_text(strip=True)
+
+    # 乖離率の抽出
+    ma25_diff = "-"
+    ma75_diff = "-"
+    trend_div = _TREND_DIV.select_one(soup)
+    if trend_div:
+        rows = trend_div.find_all('tr')
+        if len(rows) >= 2:
+            # ヘッダー行に「25日」「75日」が含まれているか確認
+            header_tds = rows[0].find_all(['th', 'td'])
+            val_tds = rows[1].find_all(['th', 'td'])
+            for i, h in enumerate(header_tds):
+                if "25日" in h.get_text():
+                    if len(val_tds) > i:
+                        ma25_diff = val_tds[i].get_text(strip=True)
+                if "75日" in h.get_text():
+                    if len(val_tds) > i:
+                        ma75_diff = val_tds[i].get_text(strip=True)
+
+    yield_val = labels.get("利回り")
+    settlement = labels.get("決算発表日")
+
+    return dict(
+        name=name,
+        current_price=current_price,
+        change=change,
+        change_percent=change_percent,
+        vwap=vwap,
+        volume=volume,
+        margin_buy=margin_buy,
+        margin_sell=margin_sell,
+        margin_ratio=margin_ratio,
+        ma25_diff=ma25_diff,
+        ma75_diff=ma75_diff,
+        dividend_yield=yield_val,
+        settlement_date=settlement,
+    )
+
+
+def parse_news(html: str, parser: str, base_url: str) -> List[dict]:
+    """ニュース一覧 (最大 15 件) を {title, url} の dict で返す"""
+    soup = make_soup(html, NEWS_SCOPE, parser)
+    news_items = []
+    table = soup.find('table', class_='s_news_list')
+    if table:
+        for row in table.find_all('tr')[:15]:
+            link = row.find('a')
+            if link:
+                title = link.get_text(strip=True)
+                href = link.get('href')
+                if not href.startswith('http'):
+                    href = f"{base_url}{href}"
+                news_items.append({"title": title, "url": href})
+    return news_items
+
+
+def parse_history(html: str, parser: str) -> HistoryColumns:
+    """日足テーブルを列指向の HistoryColumns にする"""
+    soup = make_soup(html, HISTORY_SCOPE, parser)
+    dates = []
+    cells = {"open": [], "high": [], "low": [], "close": [], "volume": []}
+
+    # 履歴テーブル (日付, 始値, 高値, 安値, 終値, 前日比, 騰落率, 売買高)
+    # セル文字列を列ごとに集め、数値化・並べ替えは HistoryColumns でまとめて行う
+    tables = _HISTORY_TABLES.select(soup)
+    for table in tables:
+        tbody = table.find('tbody')
+        if not tbody: continue
+        rows = tbody.find_all('tr')
+        for row in rows:
+            tds = row.find_all(['th', 'td'])
+            if len(tds) >= 8:
+                # 日付はthのtimeタグ
+                date_tag = tds[0].find('time')
+                dates.append(date_tag.get('datetime') if date_tag else tds[0].get_text(strip=True))
+                cells["open"].append(tds[1].get_text(strip=True))
+                cells["high"].append(tds[2].get_text(strip=True))
+                cells["low"].append(tds[3].get_text(strip=True))
+                cells["close"].append(tds[4].get_text(strip=True))
+                cells["volume"].append(tds[7].get_text(strip=True))
+
+    return HistoryColumns.from_cells(dates, cells)
+
+
+PARSERS = {
+    "details": parse_details,
+    "news": parse_news,
+    "history": parse_history,
+}
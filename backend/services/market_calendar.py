@@ -0,0 +1,142 @@
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable, Optional, Set
+
+# 東証の取引カレンダー (祝日・年末年始・前場/昼休み/後場/クロージング・オークション)。
+
+JST = timezone(timedelta(hours=9), "JST")
+
+OPEN = time(9, 0)
+LUNCH_START = time(11, 30)
+LUNCH_END = time(12, 30)
+CLOSING_AUCTION = time(15, 25)
+CLOSE = time(15, 30)
+
+# 値が動く (場中) フェーズ
+LIVE_PHASES = ("morning", "afternoon", "closing_auction", "settling")
+# 場が閉じている間は次の寄り付きまで変わらない種別
+MARKET_BOUND_KINDS = ("quote", "history", "indicators", "chart")
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    first = date(year, month, 1)
+    return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+
+@lru_cache(maxsize=64)
+def japanese_holidays(year: int) -> frozenset:
+    """国民の祝日・振替休日・国民の休日 (2020 年以降の規定。春分・秋分は 2099 年までの近似式)"""
+    days = {
+        date(year, 1, 1), date(year, 2, 11), date(year, 2, 23), date(year, 4, 29),
+        date(year, 5, 3), date(year, 5, 4), date(year, 5, 5), date(year, 8, 11),
+        date(year, 11, 3), date(year, 11, 23),
+        _nth_weekday(year, 1, 0, 2),   # 成人の日
+        _nth_weekday(year, 7, 0, 3),   # 海の日
+        _nth_weekday(year, 9, 0, 3),   # 敬老の日
+        _nth_weekday(year, 10, 0, 2),  # スポーツの日
+    }
+    leap = (year - 1980) // 4
+    days.add(date(year, 3, int(20.8431 + 0.242194 * (year - 1980)) - leap))   # 春分の日
+    days.add(date(year, 9, int(23.2488 + 0.242194 * (year - 1980)) - leap))   # 秋分の日
+
+    # 振替休日: 日曜の祝日の後の最初の平日
+    for d in sorted(days):
+        if d.weekday() == 6:
+            sub = d + timedelta(days=1)
+            while sub in days:
+                sub += timedelta(days=1)
+            days.add(sub)
+    # 国民の休日: 前後を祝日に挟まれた平日
+    for d in sorted(days):
+        middle = d + timedelta(days=1)
+        if middle not in days and d + timedelta(days=2) in days and middle.weekday() != 6:
+            days.add(middle)
+    return frozenset(days)
+
+
+class MarketCalendar:
+    """東証の立会時間と休場日
+
+    - 休場日: 土日・祝日・年末年始 (12/31〜1/3)・extra_holidays
+    - settle_minutes: 大引け後も終値の反映を待つ間は場中として扱う
+    - warm_lead_minutes: 寄り付き前のこの時間を pre_open (先読み) とする
+    """
+
+    def __init__(self, extra_holidays: Iterable[str] = (), settle_minutes: float = 15.0,
+                 warm_lead_minutes: float = 15.0):
+        self.extra_holidays: Set[date] = {date.fromisoformat(d.strip()) for d in extra_holidays if d.strip()}
+        self.settle = timedelta(minutes=settle_minutes)
+        self.warm_lead = timedelta(minutes=warm_lead_minutes)
+
+    @staticmethod
+    def now() -> datetime:
+        return datetime.now(JST)
+
+    def is_trading_day(self, day: date) -> bool:
+        if day.weekday() >= 5 or day in self.extra_holidays:
+            return False
+        if (day.month, day.day) in ((12, 31), (1, 1), (1, 2), (1, 3)):
+            return False
+        return day not in japanese_holidays(day.year)
+
+    def _at(self, day: date, t: time) -> datetime:
+        return datetime.combine(day, t, JST)
+
+    def phase(self, now: Optional[datetime] = None) -> str:
+        """closed / pre_open / morning / lunch / afternoon / closing_auction / settling / after_close"""
+        now = (now or self.now()).astimezone(JST)
+        day = now.date()
+        if not self.is_trading_day(day):
+            return "closed"
+        if now < self._at(day, OPEN):
+            return "pre_open" if now >= self._at(day, OPEN) - self.warm_lead else "closed"
+        if now < self._at(day, LUNCH_START):
+            return "morning"
+        if now < self._at(day, LUNCH_END):
+            return "lunch"
+        if now < self._at(day, CLOSING_AUCTION):
+            return "afternoon"
+        if now < self._at(day, CLOSE):
+            return "closing_auction"
+        if now < self._at(day, CLOSE) + self.settle:
+            return "settling"
+        return "after_close"
+
+    def is_live(self, now: Optional[datetime] = None) -> bool:
+        return self.phase(now) in LIVE_PHASES
+
+    def next_open(self, now: Optional[datetime] = None) -> datetime:
+        """次に値が動き出す時刻 (昼休み中なら後場の寄り付き)"""
+        now = (now or self.now()).astimezone(JST)
+        day = now.date()
+        if self.is_trading_day(day):
+            if now < self._at(day, OPEN):
+                return self._at(day, OPEN)
+            if self._at(day, LUNCH_START) <= now < self._at(day, LUNCH_END):
+                return self._at(day, LUNCH_END)
+        day += timedelta(days=1)
+        while not self.is_trading_day(day):
+            day += timedelta(days=1)
+        return self._at(day, OPEN)
+
+    def ttl(self, kind: str, base: float, now: Optional[datetime] = None) -> float:
+        """キャッシュ TTL の調整: 場が閉じている間、値の変わらない種別は次の寄り付きまで保持する"""
+        if kind not in MARKET_BOUND_KINDS:
+            return base
+        now = (now or self.now()).astimezone(JST)
+        phase = self.phase(now)
+        if phase in LIVE_PHASES:
+            return base
+        until = self.next_open(now) - now
+        if phase in ("closed", "after_close"):
+            # 寄り付き前の先読みで取り直せるよう、先読み開始までに切れるようにする
+            until -= self.warm_lead
+        return max(base, until.total_seconds())
+
+    def stats(self, now: Optional[datetime] = None) -> dict:
+        now = (now or self.now()).astimezone(JST)
+        return {
+            "phase": self.phase(now),
+            "now": now.isoformat(timespec="seconds"),
+            "next_open": self.next_open(now).isoformat(timespec="seconds"),
+        }
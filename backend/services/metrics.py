@@ -0,0 +1,212 @@
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Prometheus テキスト形式のメトリクス (段階別の所要時間・上流のステータス・キャッシュのヒット数)。
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+_LE_INF = 'le="+Inf"'
+
+# 1 リクエスト内の span は同じ抽選結果を使う (None ならその都度抽選)
+_request_sampled: contextvars.ContextVar[Optional[bool]] = contextvars.ContextVar("metrics_request_sampled", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, list] = {}   # labels → [バケット別件数..., 合計, 件数]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = 'le="%s"' % _number(bound)
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, _LE_INF)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Counter / Histogram の登録と Prometheus テキスト形式での出力
+
+    collect() で登録した関数は出力のたびに呼ばれ、既存の stats() などの値を
+    counter / gauge として書き出す (関数は {ラベル値タプル: 値} を返す)。
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Tuple[str, str, str, Tuple[str, ...], Callable[[], Dict[LabelValues, float]]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self, name: str, kind: str, help: str, labelnames: Iterable[str],
+                fn: Callable[[], Dict[LabelValues, float]]) -> None:
+        self._collectors.append((name, kind, help, tuple(labelnames), fn))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, kind, help, labelnames, fn in self._collectors:
+            try:
+                values = fn()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{_labels(labelnames, labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class PipelineMetrics(MetricsRegistry):
+    """スクレイピング処理の段階別計測 (FastAPI / Flask で同じメトリクス名を使う)
+
+    stage は queue (レート制御待ち) / connect / ttfb / download / parse / validate / request など、
+    kind はページ種別 (quote / news / history / name)。
+    所要時間のヒストグラムは sample_rate の割合のリクエストだけ記録し、件数系のカウンターは常に数える。
+    """
+
+    def __init__(self, sample_rate: float = 1.0, prefix: str = "tradeinfo"):
+        super().__init__()
+        self.prefix = prefix
+        self.sample_rate = sample_rate
+        self.stage_seconds = self.histogram(
+            f"{prefix}_stage_seconds", "Time spent per pipeline stage", ("stage", "kind"))
+        self.upstream_responses = self.counter(
+            f"{prefix}_upstream_responses_total", "Upstream responses by status (0 = transport error)", ("kind", "status"))
+        self.upstream_bytes = self.counter(
+            f"{prefix}_upstream_bytes_total", "Upstream response body bytes", ("kind",))
+        self.failures = self.counter(
+            f"{prefix}_failures_total", "Pipeline failures by stage and error type", ("stage", "kind", "error"))
+        self.http_responses = self.counter(
+            f"{prefix}_http_responses_total", "Responses served by route and status", ("route", "status"))
+
+    def sampled(self) -> bool:
+        value = _request_sampled.get()
+        if value is not None:
+            return value
+        rate = self.sample_rate
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+    @contextmanager
+    def request_scope(self):
+        """1 リクエスト分の抽選を行い、配下の span に引き継ぐ。抽選結果を返す"""
+        token = _request_sampled.set(None)
+        sampled = self.sampled()
+        _request_sampled.set(sampled)
+        try:
+            yield sampled
+        finally:
+            _request_sampled.reset(token)
+
+    def response(self, route: str, status: int, seconds: Optional[float] = None) -> None:
+        self.http_responses.inc(route, str(status))
+        if seconds is not None:
+            self.observe("request", route, seconds)
+
+    def observe(self, stage: str, kind: str, seconds: float) -> None:
+        self.stage_seconds.observe(seconds, stage, kind)
+
+    @contextmanager
+    def span(self, stage: str, kind: str, sampled: Optional[bool] = None):
+        """with ブロックの所要時間を記録する。例外は failures に数えて送出し直す"""
+        if sampled is None:
+            sampled = self.sampled()
+        started = time.perf_counter() if sampled else 0.0
+        try:
+            yield
+        except BaseException as e:
+            self.failures.inc(stage, kind, type(e).__name__)
+            raise
+        finally:
+            if sampled:
+                self.observe(stage, kind, time.perf_counter() - started)
+
+    def upstream(self, kind: str, status: int, size: int = 0) -> None:
+        self.upstream_responses.inc(kind, str(status))
+        if size:
+            self.upstream_bytes.inc(kind, amount=size)
+
+    def collect_cache(self, cache) -> None:
+        """ResponseCache.stats() をカウンターとして出力する"""
+        name = f"{self.prefix}_cache_lookups_total"
+
+        def values():
+            s = cache.stats()
+            return {("hit",): s["hits"], ("stale",): s["stale_hits"], ("miss",): s["misses"]}
+
+        self.collect(name, "counter", "Response cache lookups by result", ("result",), values)
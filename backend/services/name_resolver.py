@@ -0,0 +1,124 @@
+import csv
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .scheduler import BACKGROUND, priority
+
+# 銘柄コード → 銘柄名の解決 (Flask のウォッチリスト一括インポート用)。
+
+_CODE = re.compile(r"^\d{4}$")
+
+
+def load_master(path: str) -> Dict[str, str]:
+    """銘柄マスター CSV (1 列目コード, 2 列目銘柄名) を読む。ヘッダー行などは読み飛ばす"""
+    for encoding in ("utf-8-sig", "cp932"):
+        try:
+            with open(path, newline="", encoding=encoding) as f:
+                return {
+                    row[0].strip(): row[1].strip()
+                    for row in csv.reader(f)
+                    if len(row) >= 2 and _CODE.match(row[0].strip()) and row[1].strip()
+                }
+        except UnicodeDecodeError:
+            continue
+    return {}
+
+
+class NameResolver:
+    """マスター表 → キャッシュ → 上流取得 (上限付きスレッドプールで並列) の順に銘柄名を引く
+
+    - fetch(code) は上流から銘柄名を取る関数 (失敗時は空文字)
+    - cached(code) は既存キャッシュから通信なしで銘柄名を引く関数 (無ければ None)
+    - マスター CSV はファイルが更新された時だけ読み直す
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], str],
+        master_path: Optional[str] = None,
+        cached: Optional[Callable[[str], Optional[str]]] = None,
+        workers: int = 8,
+    ):
+        self.fetch = fetch
+        self.master_path = master_path
+        self.cached = cached
+        self.workers = workers
+        self._master: Dict[str, str] = {}
+        self._master_mtime: Optional[int] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: set = set()
+        self._lock = threading.Lock()
+        self.master_hits = 0
+        self.cache_hits = 0
+        self.fetched = 0
+
+    def _master_table(self) -> Dict[str, str]:
+        if not self.master_path:
+            return self._master
+        try:
+            mtime = os.stat(self.master_path).st_mtime_ns
+        except OSError:
+            return self._master
+        if mtime != self._master_mtime:
+            self._master = load_master(self.master_path)
+            self._master_mtime = mtime
+        return self._master
+
+    def lookup(self, code: str) -> Optional[str]:
+        """通信せずに分かる銘柄名を返す (マスター表 → キャッシュ)。分からなければ None"""
+        with self._lock:
+            name = self._master_table().get(code)
+            if name:
+                self.master_hits += 1
+                return name
+        if self.cached is not None:
+            name = self.cached(code)
+            if name:
+                with self._lock:
+                    self.cache_hits += 1
+                return name
+        return None
+
+    def resolve_async(self, codes: Iterable[str], on_resolved: Callable[[str, str], None]) -> List[str]:
+        """codes を裏で並列に取得し、1 件ごとに on_resolved(code, name) を呼ぶ。投入したコードを返す"""
+        submitted = []
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="name-resolver")
+            for code in codes:
+                if code in self._pending:
+                    continue
+                self._pending.add(code)
+                self._executor.submit(self._run, code, on_resolved)
+                submitted.append(code)
+        return submitted
+
+    def _run(self, code: str, on_resolved: Callable[[str, str], None]) -> None:
+        try:
+            # 一括インポートの名前解決は画面操作より低い優先度で取得する
+            with priority(BACKGROUND):
+                name = self.fetch(code) or ""
+            with self._lock:
+                self.fetched += 1
+            if name:
+                on_resolved(code, name)
+        finally:
+            with self._lock:
+                self._pending.discard(code)
+
+    def pending(self) -> set:
+        with self._lock:
+            return set(self._pending)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "master_size": len(self._master),
+                "master_hits": self.master_hits,
+                "cache_hits": self.cache_hits,
+                "fetched": self.fetched,
+                "pending": len(self._pending),
+            }
@@ -0,0 +1,45 @@
+import re
+import unicodedata
+from typing import Any, Optional
+
+# 株探の表示文字列 ("2,850円" / "+1.24" / "12,345,600 株" / "4.60倍" / "2.81％" / "▲3.1%") を数値にする
+
+# StockDetails のうち数値として扱うフィールド
+NUMERIC_FIELDS = (
+    "current_price", "change", "change_percent", "vwap", "volume",
+    "margin_buy", "margin_sell", "margin_ratio", "ma25_diff", "ma75_diff", "dividend_yield",
+)
+
+_NUMBER = re.compile(r"([+-]?)\s*(\d+(?:\.\d+)?)")
+# 数値の直後に付く桁の単位 (千株・百万円・億円など)
+_SCALES = (("百万", 1e6), ("兆", 1e12), ("億", 1e8), ("万", 1e4), ("千", 1e3))
+# ▲ / △ はマイナスを表す
+_NEGATIVE_MARKS = ("▲", "△")
+
+
+def parse_number(text: Any) -> Optional[float]:
+    """表示文字列を float にする。% はパーセント値のまま (3% → 3.0)、倍・株・円は単位を外すだけ。
+
+    桁の単位 (千・万・百万・億・兆) は掛ける。"-" や "---" など数値の無い表示は None。
+    """
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return float(text)
+    # 全角数字・全角記号 (％, ＋, －, ，) を半角にそろえる
+    s = unicodedata.normalize("NFKC", str(text)).replace(",", "").replace("−", "-").strip()
+    negative = s.startswith(_NEGATIVE_MARKS)
+    if negative:
+        s = s[1:]
+    m = _NUMBER.search(s)
+    if m is None:
+        return None
+    value = float(m.group(2))
+    if negative or m.group(1) == "-":
+        value = -value
+    rest = s[m.end():].lstrip()
+    for unit, scale in _SCALES:
+        if rest.startswith(unit):
+            value *= scale
+            break
+    return value
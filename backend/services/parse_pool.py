@@ -0,0 +1,75 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+
+class ParsePool:
+    """CPU 負荷の高い HTML パースをイベントループの外で実行する
+
+    mode:
+      - process: ワーカープロセス (コア数に応じてスケール。既定)
+      - thread:  スレッド (GIL を解放するパーサー向け)
+      - inline:  イベントループ上で直接実行 (デバッグ用)
+    """
+
+    MODES = ("process", "thread", "inline")
+    # ワーカーで使うモジュールは forkserver に読み込んでおき、ワーカーごとの import を省く
+    PRELOAD = ("services.kabutan_parser",)
+
+    def __init__(self, mode: str = "process", workers: int = 0):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown parse executor: {mode}")
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self._executor: Optional[Executor] = None
+        self.submitted = 0
+        self.running = 0
+
+    def start(self) -> None:
+        if self._executor is not None or self.mode == "inline":
+            return
+        if self.mode == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self._mp_context())
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parse")
+
+    def _mp_context(self):
+        # 既定の fork はスレッド (httpx・asyncio.to_thread) が動いているプロセスを複製するため、
+        # 子が引き継いだロックで固まることがある。単一スレッドの forkserver (無ければ spawn) から起動する
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(list(self.PRELOAD))
+            return context
+        return multiprocessing.get_context("spawn")
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        self.submitted += 1
+        if self.mode == "inline":
+            return fn(*args)
+        if self._executor is None:
+            self.start()
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except BrokenProcessPool:
+            # ワーカーが異常終了した場合は次回の呼び出しに備えてプールを作り直す
+            self.close()
+            raise
+        finally:
+            self.running -= 1
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers if self.mode != "inline" else 0,
+            "submitted": self.submitted,
+            "running": self.running,
+        }
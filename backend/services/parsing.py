@@ -0,0 +1,211 @@
+import os
+from typing import Iterable, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.dammit import UnicodeDammit
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:  # lxml は任意 (無ければ SoupStrainer だけで絞り込む)
+    lxml_html = None
+
+# 株探ページ用の HTML パーサー設定 (FastAPI / Flask 共通)。
+# 既定は C 実装の lxml。未インストール環境では標準の html.parser にフォールバックする。
+
+PARSERS = ("lxml", "html.parser", "html5lib")
+
+
+def _installed(parser: str) -> bool:
+    module = {"lxml": "lxml", "html5lib": "html5lib"}.get(parser)
+    if module is None:
+        return True
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_parser(preferred: Optional[str] = None) -> str:
+    """使用するパーサー名を返す (KABUTAN_HTML_PARSER で上書き可)"""
+    preferred = preferred or os.environ.get("KABUTAN_HTML_PARSER") or "lxml"
+    if preferred not in PARSERS:
+        raise ValueError(f"Unknown HTML parser: {preferred}")
+    return preferred if _installed(preferred) else "html.parser"
+
+
+DEFAULT_PARSER = resolve_parser()
+
+
+def set_default_parser(name: str) -> None:
+    global DEFAULT_PARSER
+    DEFAULT_PARSER = resolve_parser(name)
+
+
+class PageScope(SoupStrainer):
+    """必要な領域だけをツリー化する SoupStrainer
+
+    タグ名・class・id のいずれかに一致した要素を部分木ごと残し、それ以外は捨てる。
+    bs4 4.13 以降 (allow_tag_creation) とそれ以前 (search_tag) の両方に対応する。
+    """
+
+    def __init__(self, names: Iterable[str] = (), classes: Iterable[str] = (), ids: Iterable[str] = ()):
+        super().__init__()
+        self.names = frozenset(names)
+        self.classes = frozenset(classes)
+        self.ids = frozenset(ids)
+
+    def in_scope(self, name: str, attrs) -> bool:
+        if name in self.names:
+            return True
+        if not attrs:
+            return False
+        if self.ids and attrs.get("id") in self.ids:
+            return True
+        value = attrs.get("class")
+        if not value:
+            return False
+        values = value.split() if isinstance(value, str) else value
+        return any(v in self.classes for v in values)
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        return self.in_scope(name, attrs)
+
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        if isinstance(markup_name, str):
+            return self.in_scope(markup_name, dict(markup_attrs or {}))
+        return super().search_tag(markup_name, markup_attrs)
+
+
+# 詳細ページ: 銘柄情報のブロック (#stockinfo / #kobetsu_left / #kobetsu_right) だけを残す。
+# 株価・前日比・VWAP・出来高・利回り・決算発表日・信用残・乖離率はすべてこの中にあり、
+# ページ全体の表 (ランキング・サイドバー) はツリー化しない
+DETAIL_BLOCK_IDS = ("stockinfo", "kobetsu_left", "kobetsu_right")
+DETAIL_SCOPE = PageScope(
+    classes=("company_block", "kabuka", "si_i1_dl1", "kabuka_trend", "margin_table", "kairi_table"),
+    ids=DETAIL_BLOCK_IDS + ("stockinfo_i1", "stockinfo_i2", "stockinfo_i3"),
+)
+# 銘柄情報のブロックが無いページ (構造の変更など) では、表と見出しをすべて残して解析し直す
+DETAIL_FALLBACK_SCOPE = PageScope(
+    names=("table", "h2"),
+    classes=("company_block", "kabuka", "si_i1_dl1", "kabuka_trend"),
+    ids=("stockinfo_i1", "stockinfo_i2", "stockinfo_i3"),
+)
+NAME_SCOPE = PageScope(classes=("company_block",))
+NEWS_SCOPE = PageScope(classes=("s_news_list",))
+HISTORY_SCOPE = PageScope(classes=("stock_kabuka0", "stock_kabuka_dwm"))
+
+
+def make_soup(html, scope: Optional[SoupStrainer] = None, parser: Optional[str] = None) -> BeautifulSoup:
+    """株探ページを解析する。scope を渡すとその領域だけをツリー化する"""
+    return BeautifulSoup(html, parser or DEFAULT_PARSER, parse_only=scope)
+
+
+if lxml_html is not None:
+    # 銘柄情報のブロックのうち、別のブロックの内側に無いもの (文書順)
+    _DETAIL_BLOCKS_XPATH = etree.XPath(
+        "//*[{0}][not(ancestor::*[{0}])]".format(" or ".join(f'@id="{i}"' for i in DETAIL_BLOCK_IDS)))
+
+
+def _detail_fragment(html) -> Optional[str]:
+    """lxml (C 実装) で銘柄情報のブロックだけを切り出した HTML を返す。切り出せなければ None
+
+    BeautifulSoup はスコープ外のタグにも 1 つずつ Python のコールバックを呼ぶため、
+    ページ全体を渡さず、必要なブロックだけを渡してツリー化する。
+    """
+    if isinstance(html, bytes):
+        # 文字コードは BeautifulSoup と同じ方法で判定する (lxml は meta が無いと latin-1 と見なす)
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+    try:
+        blocks = _DETAIL_BLOCKS_XPATH(lxml_html.fromstring(html))
+    except (ValueError, etree.ParserError):
+        return None
+    if not blocks:
+        return None
+    return "".join(lxml_html.tostring(block, encoding="unicode", with_tail=False) for block in blocks)
+
+
+def make_detail_soup(html, parser: Optional[str] = None) -> BeautifulSoup:
+    """詳細ページを解析する。銘柄情報のブロックが見つからなければ DETAIL_FALLBACK_SCOPE で取り直す"""
+    parser = parser or DEFAULT_PARSER
+    if parser == "lxml" and lxml_html is not None:
+        fragment = _detail_fragment(html)
+        if fragment is not None:
+            return make_soup(fragment, DETAIL_SCOPE, parser)
+        return make_soup(html, DETAIL_FALLBACK_SCOPE, parser)
+    soup = make_soup(html, DETAIL_SCOPE, parser)
+    if soup.find(id=DETAIL_BLOCK_IDS) is None:
+        soup = make_soup(html, DETAIL_FALLBACK_SCOPE, parser)
+    return soup
+
+
+class LabelIndex:
+    """見出しセル → 値セル の対応を 1 回の走査で索引化する
+
+    各 th/td について
+      1. 同じ表の tbody 先頭行の同じ列 (横並びの見出し行)
+      2. 直後の兄弟 td (縦並びの見出し)
+    の順で値を求め、文書順に登録する。get(label) は「完全一致」または
+    「20 文字未満のセルに label を含む」セルのうち文書順で最初のものの値を返す。
+    """
+
+    SHORT_LABEL = 20
+
+    def __init__(self, soup: BeautifulSoup):
+        self._values = []            # 文書順の (セル文字列, 値)
+        self._exact = {}             # セル文字列 → 最初の位置
+        self._short = []             # 20 文字未満のセル文字列 (重複なし, 文書順)
+        self._memo = {}
+
+        row_positions = {}           # id(tr) → {id(cell): 列番号}
+        first_body_rows = {}         # id(table) → tbody 先頭行の td 一覧 (無ければ None)
+
+        for cell in soup.find_all(["th", "td"]):
+            text = cell.get_text(strip=True)
+            value = None
+
+            table = cell.find_parent("table")
+            if table is not None:
+                row = cell.find_parent("tr")
+                if row is not None:
+                    positions = row_positions.get(id(row))
+                    if positions is None:
+                        positions = {id(c): i for i, c in enumerate(row.find_all(["th", "td"]))}
+                        row_positions[id(row)] = positions
+                    tbody = table.find("tbody")
+                    if tbody and tbody != row.parent:
+                        if id(table) not in first_body_rows:
+                            trs = tbody.find_all("tr")
+                            first_body_rows[id(table)] = trs[0].find_all("td") if trs else None
+                        target_tds = first_body_rows[id(table)]
+                        idx = positions[id(cell)]
+                        if target_tds is not None and len(target_tds) > idx:
+                            value = target_tds[idx].get_text(strip=True)
+
+            if value is None:
+                td = cell.find_next_sibling("td")
+                if td:
+                    value = td.get_text(strip=True)
+            if value is None:
+                continue
+
+            if text not in self._exact:
+                self._exact[text] = len(self._values)
+                if len(text) < self.SHORT_LABEL:
+                    self._short.append(text)
+            self._values.append((text, value))
+
+    def get(self, label: str, default: str = "-") -> str:
+        if label in self._memo:
+            return self._memo[label]
+        best = self._exact.get(label)
+        for text in self._short:
+            if label in text:
+                pos = self._exact[text]
+                if best is None or pos < best:
+                    best = pos
+                break  # _short は文書順なので最初の一致が最小位置
+        result = self._values[best][1] if best is not None else default
+        self._memo[label] = result
+        return result
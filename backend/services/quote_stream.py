@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional, Set
+
+from services.market_calendar import MarketCalendar
+from services.scheduler import BACKGROUND, request_priority
+
+logger = logging.getLogger(__name__)
+
+# 配信対象のフィールド (変化したものだけを送る)
+QUOTE_FIELDS = ("current_price", "change", "change_percent", "volume", "vwap")
+
+
+class QuoteHub:
+    """銘柄ごとに 1 本の上流ポーラーを持ち、購読者へ差分を配信する
+
+    購読者が何人いても上流へのアクセスは銘柄数に比例する。
+    最後の購読者が抜けた銘柄のポーラーは停止する。
+    calendar を渡すと、場が閉じている間は上流へ取りに行かずキャッシュの最後の値を配信し、
+    次の寄り付きまで間隔を空ける。
+    """
+
+    # 場が閉じている間の確認間隔の上限 (時計の変更や臨時休場の設定に追従するため)
+    MAX_SLEEP = 600.0
+
+    def __init__(self, service, interval: float, queue_size: int = 100,
+                 calendar: Optional[MarketCalendar] = None):
+        self.service = service
+        self.interval = interval
+        self.calendar = calendar
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._pollers: Dict[str, asyncio.Task] = {}
+        self._last: Dict[str, dict] = {}
+        self.polls = 0
+        self.events = 0
+
+    def subscribe(self, codes: Iterable[str]) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        for code in codes:
+            self._subscribers.setdefault(code, set()).add(queue)
+            # 既に値を持っている銘柄は現在値を即座に送る
+            if code in self._last:
+                self._push(queue, {"code": code, **self._last[code]})
+            if code not in self._pollers:
+                self._pollers[code] = asyncio.create_task(self._poll(code))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, codes: Iterable[str]) -> None:
+        for code in codes:
+            subscribers = self._subscribers.get(code)
+            if not subscribers:
+                continue
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[code]
+                poller = self._pollers.pop(code, None)
+                if poller:
+                    poller.cancel()
+                self._last.pop(code, None)
+
+    async def close(self) -> None:
+        pollers = list(self._pollers.values())
+        for poller in pollers:
+            poller.cancel()
+        await asyncio.gather(*pollers, return_exceptions=True)
+        self._pollers.clear()
+        self._subscribers.clear()
+
+    async def _poll(self, code: str) -> None:
+        # ポーラーのタスク内だけバックグラウンドレーンにする
+        request_priority.set(BACKGROUND)
+        while True:
+            live = self.calendar is None or self.calendar.is_live()
+            try:
+                self.polls += 1
+                if live:
+                    # 複数ワーカー時は、他のワーカーが 1 間隔以内に取り直した値を使う
+                    quote = await self.service.refresh_quote(code, max_age=self.interval)
+                else:
+                    # 場が閉じている間は次の寄り付きまで保持される最後の値を読むだけ
+                    quote = await self.service.get_quote(code)
+                if quote is not None:
+                    self._publish(code, quote)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("quote poll failed for %s", code, exc_info=True)
+            await asyncio.sleep(self.interval if live else self._sleep_until_open())
+
+    def _sleep_until_open(self) -> float:
+        now = self.calendar.now()
+        until = (self.calendar.next_open(now) - now).total_seconds()
+        return min(max(until, self.interval), self.MAX_SLEEP)
+
+    def _publish(self, code: str, quote: dict) -> None:
+        last = self._last.get(code, {})
+        changed = {k: quote.get(k) for k in QUOTE_FIELDS if quote.get(k) != last.get(k)}
+        if not changed:
+            return
+        self._last[code] = {k: quote.get(k) for k in QUOTE_FIELDS}
+        event = {"code": code, **changed}
+        for queue in self._subscribers.get(code, ()):
+            self._push(queue, event)
+
+    def _push(self, queue: asyncio.Queue, event: dict) -> None:
+        # 遅いクライアントはポーラーを止めず、古いイベントから捨てる
+        if queue.full():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(event)
+        self.events += 1
+
+    def stats(self) -> dict:
+        return {
+            "tickers": len(self._pollers),
+            "subscriptions": sum(len(s) for s in self._subscribers.values()),
+            "polls": self.polls,
+            "events": self.events,
+        }
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from datetime import date
+from typing import List, Optional
+
+from services.market_calendar import LIVE_PHASES, MarketCalendar
+from services.scheduler import BACKGROUND, request_priority
+from services.watchlist import WatchlistRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class MarketRefresher:
+    """取引時間に合わせてウォッチリスト銘柄をキャッシュへ載せ続ける
+
+    - 寄り付き前 (pre_open): 取引日ごとに 1 回、詳細・ニュース・履歴を先読みする
+    - 場中: interval 秒ごとに詳細 (株価) を取り直す
+    - 場が閉じた直後 (昼休み・大引け後): 最後に 1 回取り直し、そのスナップショットを
+      次の寄り付きまでの長い TTL でキャッシュさせる (TTL は MarketCalendar.ttl)
+    """
+
+    # 場が閉じている間に寝る最大秒数 (スリープ復帰や時計の変更に追従するため)
+    MAX_SLEEP = 600.0
+
+    def __init__(self, service, calendar: MarketCalendar, watchlist: WatchlistRegistry,
+                 interval: float = 60.0, concurrency: int = 4):
+        self.service = service
+        self.calendar = calendar
+        self.watchlist = watchlist
+        self.interval = interval
+        self.concurrency = concurrency
+        self._task: Optional[asyncio.Task] = None
+        self._warmed_on: Optional[date] = None
+        self._was_live = False
+        self.warm_runs = 0
+        self.refresh_runs = 0
+        self.failures = 0
+        self.last_run: Optional[float] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        # このタスク内の上流アクセスはすべてバックグラウンドレーン
+        request_priority.set(BACKGROUND)
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("market refresh failed", exc_info=True)
+            await asyncio.sleep(self._sleep_for())
+
+    async def tick(self) -> None:
+        """現在のフェーズに応じて先読み / 定期更新を 1 回分行う"""
+        now = self.calendar.now()
+        phase = self.calendar.phase(now)
+        live = phase in LIVE_PHASES
+        if phase == "pre_open" and self._warmed_on != now.date():
+            self._warmed_on = now.date()
+            await self.warm()
+        elif live or self._was_live:
+            await self.refresh()
+        self._was_live = live
+
+    # max_age: 複数ワーカーで動かす時、他のワーカーが先に取り直した値はそのまま使う
+    async def warm(self) -> None:
+        self.warm_runs += 1
+        max_age = self.calendar.warm_lead.total_seconds()
+        await self._each(lambda code: self.service.warm(code, max_age))
+
+    async def refresh(self) -> None:
+        self.refresh_runs += 1
+        await self._each(lambda code: self.service.refresh_quote(code, self.interval))
+
+    async def _each(self, fn) -> None:
+        codes: List[str] = self.watchlist.codes()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(code: str) -> None:
+            async with semaphore:
+                try:
+                    await fn(code)
+                except Exception:
+                    self.failures += 1
+                    logger.debug("refresh failed for %s", code, exc_info=True)
+
+        await asyncio.gather(*(one(code) for code in codes))
+        self.last_run = time.time()
+
+    def _sleep_for(self) -> float:
+        now = self.calendar.now()
+        if self.calendar.is_live(now):
+            return self.interval
+        # 次の先読み開始 / 寄り付きのうち近い方まで寝る
+        next_open = self.calendar.next_open(now)
+        wake = next((t for t in (next_open - self.calendar.warm_lead, next_open) if t > now), next_open)
+        return min(max((wake - now).total_seconds(), 1.0), self.MAX_SLEEP)
+
+    def stats(self) -> dict:
+        return {
+            **self.calendar.stats(),
+            "running": self._task is not None,
+            "watchlist": self.watchlist.stats(),
+            "warmed_on": self._warmed_on.isoformat() if self._warmed_on else None,
+            "warm_runs": self.warm_runs,
+            "refresh_runs": self.refresh_runs,
+            "failures": self.failures,
+            "last_run": self.last_run,
+        }
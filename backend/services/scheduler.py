@@ -0,0 +1,252 @@
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# 上流 (株探) へのアクセスを一元管理するスケジューラー。
+# FastAPI (async) と Flask (スレッド) の両方から使うため、状態は threading.Lock で守り、
+# 待機だけを asyncio.sleep / time.sleep で切り替える。
+
+INTERACTIVE = 0   # 画面で選択中の銘柄など、ユーザーが待っているリクエスト
+BACKGROUND = 1    # ウォッチリスト更新・ライブ配信のポーリングなど
+LANES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+request_priority: contextvars.ContextVar[int] = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(lane: int):
+    """with ブロック内の上流アクセスを指定レーンで実行する"""
+    token = request_priority.set(lane)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class _HostState:
+    def __init__(self, rate: float, burst: float):
+        self.base_rate = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.cooldown_until = 0.0
+        self.failures = 0
+        self.throttled = 0
+        self.slow = 0
+
+
+class UpstreamScheduler:
+    """グローバル / ホスト別トークンバケット + 優先レーン + 適応的バックオフ
+
+    - 先に並んだ同一ホストの要求、および優先度の高いレーンの要求を追い越さない
+    - 429 / 5xx / 通信エラーでホストのレートを半減し、Retry-After か指数バックオフで一時停止
+    - 応答が slow_threshold 秒を超えたらレートを少し下げ、正常応答で徐々に元へ戻す
+    - shared (shared_store のストア) を渡すと、全ワーカー合計のレートを rate / host_rate に抑える
+      共有トークンバケットと、429 / 5xx による一時停止の共有も行う
+    """
+
+    POLL = 0.05
+
+    def __init__(
+        self,
+        rate: float = 5.0,
+        burst: float = 10.0,
+        host_rate: float = 3.0,
+        host_burst: float = 6.0,
+        slow_threshold: float = 3.0,
+        min_rate: float = 0.2,
+        max_backoff: float = 60.0,
+        shared=None,
+        namespace: str = "tradeinfo",
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.slow_threshold = slow_threshold
+        self.min_rate = min_rate
+        self.max_backoff = max_backoff
+        self.shared = shared
+        self.namespace = namespace
+        self.shared_waits = 0
+        self._hosts: Dict[str, _HostState] = {}
+        self._waiters: Dict[int, tuple] = {}   # ticket → (lane, host)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.granted = {lane: 0 for lane in LANES}
+        self.wait_seconds = {lane: 0.0 for lane in LANES}
+
+    # ---------------------------------------------------------
+    # 取得
+    # ---------------------------------------------------------
+    async def acquire(self, host: str, lane: Optional[int] = None) -> None:
+        lane = request_priority.get() if lane is None else lane
+        ticket = self._enqueue(host, lane)
+        started = time.monotonic()
+        try:
+            while True:
+                wait = self._try_acquire(ticket, host, lane)
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait, self.POLL))
+            while self.shared is not None:
+                wait = await asyncio.to_thread(self._take_shared, host)
+                if wait == 0:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            self._leave(ticket, lane, started)
+
+    def acquire_sync(self, host: str, lane: Optional[int] = None) -> None:
+        lane = request_priority.get() if lane is None else lane
+        ticket = self._enqueue(host, lane)
+        started = time.monotonic()
+        try:
+            while True:
+                wait = self._try_acquire(ticket, host, lane)
+                if wait == 0:
+                    break
+                time.sleep(min(wait, self.POLL))
+            while self.shared is not None:
+                wait = self._take_shared(host)
+                if wait == 0:
+                    break
+                time.sleep(wait)
+        finally:
+            self._leave(ticket, lane, started)
+
+    def _take_shared(self, host: str) -> float:
+        """共有バケットからトークンを取る。取れなければ待つ秒数 (ストアの障害時は 0 = ローカルの制御だけで続ける)"""
+        try:
+            until = self.shared.get(f"{self.namespace}:cooldown:{host}")
+            if until is not None and float(until) > time.time():
+                wait = float(until) - time.time()
+            else:
+                wait = self.shared.take_token(f"{self.namespace}:bucket", self.bucket.rate, self.bucket.burst)
+                if wait == 0:
+                    wait = self.shared.take_token(f"{self.namespace}:bucket:{host}", self.host_rate, self.host_burst)
+        except Exception:
+            return 0.0
+        if wait > 0:
+            with self._lock:
+                self.shared_waits += 1
+        return wait
+
+    def _host(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.host_rate, self.host_burst)
+        return state
+
+    def _enqueue(self, host: str, lane: int) -> int:
+        with self._lock:
+            ticket = next(self._seq)
+            self._waiters[ticket] = (lane, host)
+            return ticket
+
+    def _leave(self, ticket: int, lane: int, started: float) -> None:
+        with self._lock:
+            if self._waiters.pop(ticket, None) is None:
+                self.granted[lane] += 1
+            self.wait_seconds[lane] += time.monotonic() - started
+
+    def _try_acquire(self, ticket: int, host: str, lane: int) -> float:
+        """トークンを取れたら 0、取れなければ次に試すまでの秒数を返す"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._host(host)
+            if now < state.cooldown_until:
+                return state.cooldown_until - now
+            for other, (other_lane, other_host) in self._waiters.items():
+                if other == ticket:
+                    continue
+                if other_host == host and (other_lane, other) < (lane, ticket):
+                    return self.POLL
+                if other_lane < lane and now >= self._host(other_host).cooldown_until:
+                    return self.POLL
+            wait = max(self.bucket.wait_time(now), state.bucket.wait_time(now))
+            if wait > 0:
+                return wait
+            self.bucket.tokens -= 1
+            state.bucket.tokens -= 1
+            del self._waiters[ticket]
+            return 0.0
+
+    # ---------------------------------------------------------
+    # 応答のフィードバック
+    # ---------------------------------------------------------
+    def report(self, host: str, status: int, elapsed: float, retry_after: Optional[float] = None) -> None:
+        """status=0 は通信エラー"""
+        with self._lock:
+            state = self._host(host)
+            bucket = state.bucket
+            if status == 0 or status == 429 or status >= 500:
+                state.failures += 1
+                state.throttled += 1
+                bucket.rate = max(self.min_rate, bucket.rate * 0.5)
+                backoff = min(self.max_backoff, 0.5 * 2 ** state.failures)
+                pause = retry_after if retry_after is not None else backoff
+                state.cooldown_until = time.monotonic() + pause
+                if self.shared is not None:
+                    self._share_cooldown(host, pause)
+            elif elapsed > self.slow_threshold:
+                state.slow += 1
+                bucket.rate = max(self.min_rate, bucket.rate * 0.8)
+            else:
+                state.failures = 0
+                bucket.rate = min(state.base_rate, bucket.rate * 1.1 + 0.05)
+
+    def _share_cooldown(self, host: str, pause: float) -> None:
+        # 他のワーカーも同じ時刻まで止める
+        try:
+            self.shared.set(f"{self.namespace}:cooldown:{host}", str(time.time() + pause).encode(), pause)
+        except Exception:
+            pass
+
+    @staticmethod
+    def retry_after(headers) -> Optional[float]:
+        value = headers.get("Retry-After") if headers is not None else None
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            depth = {name: 0 for name in LANES.values()}
+            for lane, _ in self._waiters.values():
+                depth[LANES[lane]] += 1
+            return {
+                "queue_depth": depth,
+                "granted": {LANES[k]: v for k, v in self.granted.items()},
+                "wait_seconds": {LANES[k]: round(v, 3) for k, v in self.wait_seconds.items()},
+                "shared": self.shared is not None,
+                "shared_waits": self.shared_waits,
+                "hosts": {
+                    host: {
+                        "rate": round(s.bucket.rate, 3),
+                        "cooldown": round(max(0.0, s.cooldown_until - now), 3),
+                        "throttled": s.throttled,
+                        "slow": s.slow,
+                    }
+                    for host, s in self._hosts.items()
+                },
+            }
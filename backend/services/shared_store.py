@@ -0,0 +1,319 @@
+import asyncio
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+
+# 複数ワーカー (uvicorn --workers / gunicorn) で共有するキャッシュと協調 (ロック・トークンバケット)。
+# 既定では使わない (open_shared_store("") は None)。URL に SQLite ファイルのパス (同一ホストのワーカー間) か
+# redis://... (任意依存) を指定した時だけ有効になる。
+#
+# ストアは Redis のコマンドに対応する最小限の操作だけを持つ:
+#   get / set (SET PX) / set_nx (SET NX PX) / delete_if (値が一致する時だけ DEL) / take_token
+
+_KV_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteSharedStore:
+    """同一ホストのプロセス間で共有するキー・バリューストア (SQLite WAL)
+
+    更新を伴う操作は BEGIN IMMEDIATE で排他するため、set_nx / take_token は
+    プロセスをまたいで原子的に動く。時刻はプロセス間で共通の time.time() を使う。
+    """
+
+    # この回数の書き込みごとに期限切れの行を掃除する
+    PURGE_EVERY = 256
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        self._connect().executescript(_KV_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 の接続はスレッドごとに持つ (トランザクションは明示的に開始する)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._connect().execute(
+            "SELECT value FROM kv WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)", (key, value, time.time() + ttl))
+        self._wrote()
+
+    def set_nx(self, key: str, value: bytes, ttl: float) -> bool:
+        def run(conn):
+            now = time.time()
+            if conn.execute("SELECT 1 FROM kv WHERE key = ? AND expires > ?", (key, now)).fetchone():
+                return False
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)", (key, value, now + ttl))
+            return True
+
+        return self._transaction(run)
+
+    def delete_if(self, key: str, value: bytes) -> bool:
+        cursor = self._connect().execute("DELETE FROM kv WHERE key = ? AND value = ?", (key, value))
+        return cursor.rowcount > 0
+
+    def take_token(self, key: str, rate: float, burst: float) -> float:
+        """トークンを 1 つ取れたら 0、取れなければ次に取れるまでの秒数を返す"""
+        def run(conn):
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            return wait
+
+        return self._transaction(run)
+
+    def _wrote(self) -> None:
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._connect().execute("DELETE FROM kv WHERE expires <= ?", (time.time(),))
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# トークンバケットは Lua スクリプトで原子的に更新する (KEYS[1], ARGV = rate, burst, now)
+_TAKE_TOKEN_LUA = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = burst
+if state[1] then
+  tokens = math.min(burst, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+end
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+_DELETE_IF_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class RedisSharedStore:
+    """Redis (および互換サーバー) を使う共有ストア。複数ホストのワーカー間で共有できる
+
+    redis パッケージは任意依存 (未インストールなら ImportError)。
+    """
+
+    def __init__(self, url: str):
+        import redis
+
+        self.url = url
+        self._redis = redis.Redis.from_url(url)
+        self._take_token = self._redis.register_script(_TAKE_TOKEN_LUA)
+        self._delete_if = self._redis.register_script(_DELETE_IF_LUA)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._redis.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._redis.set(key, value, px=max(1, int(ttl * 1000)))
+
+    def set_nx(self, key: str, value: bytes, ttl: float) -> bool:
+        return bool(self._redis.set(key, value, px=max(1, int(ttl * 1000)), nx=True))
+
+    def delete_if(self, key: str, value: bytes) -> bool:
+        return bool(self._delete_if(keys=[key], args=[value]))
+
+    def take_token(self, key: str, rate: float, burst: float) -> float:
+        return float(self._take_token(keys=[key], args=[rate, burst, time.time()]))
+
+    def close(self) -> None:
+        self._redis.close()
+
+
+def open_shared_store(url: str):
+    """"" → None (共有しない) / redis://... → Redis / sqlite:///path または path → SQLite"""
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSharedStore(url)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return SQLiteSharedStore(url)
+
+
+class SharedTier:
+    """プロセス間で共有するキャッシュ層とプロセス間 single-flight
+
+    load は 共有キャッシュ → 共有ロックを取ったプロセスだけが loader を実行 → 結果を共有キャッシュへ
+    の順に解決する。ロックを取れなかったプロセスは結果が書かれるのを待つ
+    (保持者が落ちてもロックは lock_ttl で切れ、wait_timeout を過ぎたら自分で取得する)。
+    値は pickle で保存する (自アプリが書いた値だけを読む前提)。
+    """
+
+    POLL = 0.05
+
+    def __init__(self, store, namespace: str = "tradeinfo", lock_ttl: float = 30.0, wait_timeout: float = 15.0):
+        self.store = store
+        self.namespace = namespace
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.hits = 0
+        self.loads = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def key(self, kind: str, code: str) -> str:
+        return f"{self.namespace}:{kind}:{code}"
+
+    # ---------------------------------------------------------
+    # ストア操作 (失敗しても共有なしで動き続ける)
+    # ---------------------------------------------------------
+    def _get(self, key: str, max_age: Optional[float]):
+        try:
+            blob = self.store.get(key)
+            if blob is None:
+                return None
+            stored_at, value = pickle.loads(blob)
+        except Exception:
+            self.errors += 1
+            return None
+        if max_age is not None and time.time() - stored_at > max_age:
+            return None
+        return value
+
+    def _put(self, key: str, value: Any, ttl: float) -> None:
+        if value is None:
+            return
+        try:
+            self.store.set(key, pickle.dumps((time.time(), value), pickle.HIGHEST_PROTOCOL), ttl)
+        except Exception:
+            self.errors += 1
+
+    def _lock(self, key: str, token: bytes) -> bool:
+        try:
+            return self.store.set_nx(key + ":lock", token, self.lock_ttl)
+        except Exception:
+            self.errors += 1
+            return True   # ストアが使えない時は各自で取得する
+
+    def _unlock(self, key: str, token: bytes) -> None:
+        try:
+            self.store.delete_if(key + ":lock", token)
+        except Exception:
+            self.errors += 1
+
+    # ---------------------------------------------------------
+    # 取得
+    # ---------------------------------------------------------
+    def load_sync(self, kind: str, code: str, loader: Callable[[], Any], ttl: float,
+                  max_age: Optional[float] = None) -> Any:
+        """max_age を指定すると、それより古い共有値は使わず取り直す"""
+        key = self.key(kind, code)
+        token = uuid.uuid4().bytes
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            value = self._get(key, max_age)
+            if value is not None:
+                self.hits += 1
+                return value
+            if self._lock(key, token):
+                break
+            if not waited:
+                waited = True
+                self.waits += 1
+            if time.monotonic() >= deadline:
+                self.timeouts += 1
+                return loader()
+            time.sleep(self.POLL)
+        try:
+            self.loads += 1
+            value = loader()
+            self._put(key, value, ttl)
+            return value
+        finally:
+            self._unlock(key, token)
+
+    async def load(self, kind: str, code: str, loader: Callable[[], Awaitable[Any]], ttl: float,
+                   max_age: Optional[float] = None) -> Any:
+        key = self.key(kind, code)
+        token = uuid.uuid4().bytes
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            value = await asyncio.to_thread(self._get, key, max_age)
+            if value is not None:
+                self.hits += 1
+                return value
+            if await asyncio.to_thread(self._lock, key, token):
+                break
+            if not waited:
+                waited = True
+                self.waits += 1
+            if time.monotonic() >= deadline:
+                self.timeouts += 1
+                return await loader()
+            await asyncio.sleep(self.POLL)
+        try:
+            self.loads += 1
+            value = await loader()
+            await asyncio.to_thread(self._put, key, value, ttl)
+            return value
+        finally:
+            await asyncio.shield(asyncio.to_thread(self._unlock, key, token))
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.store).__name__,
+            "hits": self.hits,
+            "loads": self.loads,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+        }
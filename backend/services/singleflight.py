@@ -0,0 +1,43 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """同じキーへの同時呼び出しを 1 回の実行にまとめる (in-flight dedupe)
+
+    先頭の呼び出しが実行するコルーチンは独立したタスクで動かすため、
+    呼び出し元の 1 つがタイムアウト等でキャンセルされても他の待機者には影響しない。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._finish(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 待機者が全員キャンセル済みでも "exception was never retrieved" を出さない
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,207 @@
+import ast
+import threading
+import time
+from typing import Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from services.numeric import NUMERIC_FIELDS, parse_number
+
+_COMPARE = {
+    ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater,
+    ast.GtE: np.greater_equal, ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+
+
+class ScreenError(ValueError):
+    """where / sort の指定が不正"""
+
+
+class SnapshotTable:
+    """取得済み銘柄の数値指標を列指向 (NumPy) で保持するスナップショット
+
+    - 詳細ページを取得するたびに upsert で 1 行を更新する (表示文字列の数値化はこの 1 回だけ)
+    - 行数が max_rows を超えたら最も古く更新された行を置き換える
+    - query は where (例: "margin_ratio < 1 and change_percent > 3") による絞り込み、
+      sort (例: "-change_percent,volume"、先頭の - で降順)、上位 limit 件の切り出しを
+      ベクトル演算で行う。値の無い (NaN) 銘柄は比較に一致せず、並べ替えでは末尾になる
+    """
+
+    def __init__(self, fields: Sequence[str] = NUMERIC_FIELDS, max_rows: int = 5000, capacity: int = 256):
+        self.fields = tuple(fields)
+        self.max_rows = max_rows
+        self._column = {name: i for i, name in enumerate(self.fields)}
+        self._values = np.full((capacity, len(self.fields)), np.nan)
+        self._updated = np.zeros(capacity)
+        self._codes: List[str] = []
+        self._names: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def upsert(self, code: str, quote: Mapping) -> None:
+        values = [parse_number(quote.get(name)) for name in self.fields]
+        row_values = np.array([np.nan if v is None else v for v in values])
+        with self._lock:
+            row = self._rows.get(code)
+            if row is None:
+                row = self._allocate(code)
+            self._names[row] = quote.get("name") or ""
+            self._values[row] = row_values
+            self._updated[row] = time.time()
+
+    def _allocate(self, code: str) -> int:
+        n = len(self._codes)
+        if n >= self.max_rows:
+            row = int(np.argmin(self._updated[:n]))
+            del self._rows[self._codes[row]]
+            self._codes[row] = code
+        else:
+            if n == len(self._values):
+                self._values = np.concatenate([self._values, np.full_like(self._values, np.nan)])
+                self._updated = np.concatenate([self._updated, np.zeros_like(self._updated)])
+            row = n
+            self._codes.append(code)
+            self._names.append("")
+        self._rows[code] = row
+        return row
+
+    def get(self, code: str) -> Optional[Dict[str, Optional[float]]]:
+        with self._lock:
+            row = self._rows.get(code)
+            if row is None:
+                return None
+            return {name: _scalar(v) for name, v in zip(self.fields, self._values[row])}
+
+    # ---------------------------------------------------------
+    # スクリーニング
+    # ---------------------------------------------------------
+    def query(self, where: Optional[str] = None, sort: Optional[str] = None, limit: int = 50,
+              fields: Optional[Sequence[str]] = None, codes: Optional[Sequence[str]] = None) -> dict:
+        fields = tuple(fields) if fields else self.fields
+        self._check_fields(fields)
+        keys = self._parse_sort(sort)
+        condition = self._compile(where) if where else None
+
+        with self._lock:
+            n = len(self._codes)
+            values = self._values[:n].copy()
+            updated = self._updated[:n].copy()
+            row_codes = list(self._codes)
+            names = list(self._names)
+            rows = self._rows
+
+            if codes is not None:
+                index = np.array(sorted({rows[c] for c in codes if c in rows}), dtype=np.intp)
+            else:
+                index = np.arange(n)
+
+        columns = values[index]
+        if condition is not None:
+            with np.errstate(invalid="ignore"):
+                index = index[condition(columns)]
+            columns = values[index]
+
+        order = self._order(columns, keys, limit)
+        index = index[order]
+        selected = [self._column[name] for name in fields]
+        now = time.time()
+        result = [
+            {
+                "code": row_codes[row],
+                "name": names[row],
+                **{name: _scalar(values[row, col]) for name, col in zip(fields, selected)},
+                "age": round(float(now - updated[row]), 1),
+            }
+            for row in index.tolist()
+        ]
+        return {"total": n, "matched": int(len(columns)), "rows": result}
+
+    def _order(self, columns: np.ndarray, keys: List[tuple], limit: int) -> np.ndarray:
+        count = len(columns)
+        limit = max(0, min(limit, count))
+        if not keys:
+            return np.arange(limit)
+        # 降順は符号を反転して昇順に並べる (NaN は常に末尾)
+        sort_cols = [columns[:, self._column[name]] * (-1.0 if desc else 1.0) for name, desc in keys]
+        if len(sort_cols) == 1:
+            key = sort_cols[0]
+            if limit < count:
+                # 上位 limit 件だけを部分ソートで取り出してから並べる
+                top = np.argpartition(key, limit - 1)[:limit] if limit else np.empty(0, dtype=np.intp)
+                return top[np.argsort(key[top], kind="stable")]
+            return np.argsort(key, kind="stable")
+        # np.lexsort は最後のキーが第 1 キー
+        return np.lexsort(sort_cols[::-1])[:limit]
+
+    def _check_fields(self, fields: Sequence[str]) -> None:
+        unknown = [f for f in fields if f not in self._column]
+        if unknown:
+            raise ScreenError(f"Unknown fields: {', '.join(unknown)}")
+
+    def _parse_sort(self, sort: Optional[str]) -> List[tuple]:
+        keys = []
+        for item in (sort or "").split(","):
+            item = item.strip()
+            if not item:
+                continue
+            desc = item.startswith("-")
+            keys.append((item.lstrip("+-"), desc))
+        self._check_fields([name for name, _ in keys])
+        return keys
+
+    def _compile(self, where: str):
+        """where 式を列配列 → 真偽マスクの関数にする (比較・and / or / not・括弧・数値のみ許可)"""
+        try:
+            tree = ast.parse(where.replace("&&", " and ").replace("||", " or "), mode="eval")
+        except SyntaxError as e:
+            raise ScreenError(f"Invalid where: {e.msg}") from None
+        column = self._column
+
+        def build(node):
+            if isinstance(node, ast.BoolOp):
+                parts = [build(v) for v in node.values]
+                combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+                return lambda cols: combine.reduce([p(cols) for p in parts])
+            if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+                inner = build(node.operand)
+                return lambda cols: ~inner(cols)
+            if isinstance(node, ast.Compare):
+                operands = [operand(node.left)] + [operand(c) for c in node.comparators]
+                ops = []
+                for op in node.ops:
+                    if type(op) not in _COMPARE:
+                        raise ScreenError(f"Unsupported operator: {type(op).__name__}")
+                    ops.append(_COMPARE[type(op)])
+                # 1 < margin_ratio < 3 のような連鎖比較も扱う
+                return lambda cols: np.logical_and.reduce(
+                    [op(a(cols), b(cols)) for op, a, b in zip(ops, operands, operands[1:])])
+            raise ScreenError(f"Unsupported expression: {ast.unparse(node)}")
+
+        def operand(node):
+            if isinstance(node, ast.Name):
+                if node.id not in column:
+                    raise ScreenError(f"Unknown fields: {node.id}")
+                i = column[node.id]
+                return lambda cols: cols[:, i]
+            if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+                value = float(node.value)
+                return lambda cols: value
+            if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)) and isinstance(node.operand, ast.Constant):
+                value = operand(node.operand)(None)
+                value = -value if isinstance(node.op, ast.USub) else value
+                return lambda cols: value
+            raise ScreenError(f"Unsupported operand: {ast.unparse(node)}")
+
+        predicate = build(tree.body)
+        return lambda cols: np.asarray(predicate(cols), dtype=bool) & np.ones(len(cols), dtype=bool)
+
+    def stats(self) -> dict:
+        return {"rows": len(self._codes), "max_rows": self.max_rows}
+
+
+def _scalar(value: float) -> Optional[float]:
+    # JSON には NaN を出せないので None にする
+    return None if value != value else float(value)
@@ -0,0 +1,5 @@
+from core.config import settings
+from services.metrics import PipelineMetrics
+
+# バックエンド全体で共有する段階別メトリクス (GET /metrics で出力)
+metrics = PipelineMetrics(sample_rate=settings.metrics_sample_rate)
@@ -0,0 +1,40 @@
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from services.favorites import FavoritesRepository
+
+
+class WatchlistRegistry:
+    """定期更新・寄り付き前の先読みの対象銘柄
+
+    Flask 版のお気に入り (favorites.json) と、ダッシュボードなどのクライアントが
+    PUT /stocks/watchlist で登録した銘柄 (Zustand のカテゴリ) の和集合。
+    """
+
+    def __init__(self, favorites: Optional[FavoritesRepository] = None, max_codes: int = 500):
+        self.favorites = favorites
+        self.max_codes = max_codes
+        self._clients: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, client: str, codes: Iterable[str]) -> List[str]:
+        """client の登録銘柄を置き換える (空なら登録を外す)"""
+        unique = list(dict.fromkeys(c.strip() for c in codes if c.strip()))[: self.max_codes]
+        with self._lock:
+            if unique:
+                self._clients[client] = unique
+            else:
+                self._clients.pop(client, None)
+        return unique
+
+    def codes(self) -> List[str]:
+        with self._lock:
+            merged = [code for codes in self._clients.values() for code in codes]
+        if self.favorites is not None:
+            merged = list(self.favorites.all()) + merged
+        return list(dict.fromkeys(merged))[: self.max_codes]
+
+    def stats(self) -> dict:
+        with self._lock:
+            clients = {name: len(codes) for name, codes in self._clients.items()}
+        return {"codes": len(self.codes()), "clients": clients}
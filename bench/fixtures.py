@@ -0,0 +1,137 @@
+"""株探ページのベンチマーク用フィクスチャ
+
+bench/fixtures/<kind>/<code>.html に record.py で保存した実ページがあればそれを使い、
+無い場合 (CI など) は株探と同じ構造の合成ページを生成する。
+kind は details (/stock/) / news (/stock/news) / history (/stock/kabuka)。
+"""
+import os
+import random
+from typing import Dict, Iterator, List, Tuple
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+KINDS = ("details", "news", "history")
+PATHS = {"details": "/stock/", "news": "/stock/news", "history": "/stock/kabuka"}
+
+# 合成ページのサイズ: ナビ・広告などのノイズ量とニュース件数・日足の行数
+SIZES = {
+    "small": {"noise": 20, "news": 5, "bars": 10},
+    "medium": {"noise": 80, "news": 15, "bars": 30},
+    "large": {"noise": 300, "news": 50, "bars": 300},
+}
+
+DEFAULT_TICKERS = ["7203", "6758", "9984", "8306", "6861", "9432", "6501", "8035", "4063", "7974"]
+
+
+def _yen(value: float) -> str:
+    return f"{value:,.0f}"
+
+
+def _noise(rng: random.Random, blocks: int) -> str:
+    # パーサーが読み飛ばすべきヘッダー・サイドバー・スクリプト相当のマークアップ
+    parts = []
+    for i in range(blocks):
+        parts.append(
+            f'<div class="side_box"><ul>'
+            + "".join(f'<li><a href="/themes/?theme={rng.randint(1, 9999)}">テーマ{i}-{j}</a></li>' for j in range(5))
+            + f'</ul><table class="ranking"><tr><th>順位</th><td>{rng.randint(1, 100)}</td></tr></table>'
+            f'<script>var ad{i} = {{"slot": {rng.randint(1, 10**6)}}};</script></div>'
+        )
+    return "\n".join(parts)
+
+
+def detail_page(code: str, noise: int, rng: random.Random) -> str:
+    price = rng.uniform(300, 30000)
+    change = rng.uniform(-0.05, 0.05) * price
+    return f"""<html><head><title>{code}</title></head><body>
+<header>{_noise(rng, noise // 2)}</header>
+<div id="stockinfo">
+<div class="company_block"><h3>{code} 銘柄{code}</h3><span class="market">東証Ｐ</span></div>
+<span class="kabuka">{_yen(price)}円</span>
+<dl class="si_i1_dl1"><dt>前日比</dt><dd>{change:+,.0f}</dd><dd>{change / price * 100:+.2f}%</dd></dl>
+<table><tr><th>VWAP</th><td>{price * 0.998:,.1f}</td></tr><tr><th>出来高</th><td>{rng.randint(10**4, 10**8):,} 株</td></tr></table>
+<table><thead><tr><th>PER</th><th>PBR</th><th>利回り</th></tr></thead><tbody><tr><td>{rng.uniform(5, 40):.1f}倍</td><td>{rng.uniform(0.3, 8):.2f}倍</td><td>{rng.uniform(0, 5):.2f}％</td></tr></tbody></table>
+<table><tr><th>決算発表日</th><td>25/11/{rng.randint(1, 28):02d}</td></tr></table>
+<h2>信用取引</h2>
+<table><thead><tr><th>売残</th><th>買残</th><th>倍率</th></tr></thead><tbody><tr><td>{rng.randint(10**4, 10**7):,}</td><td>{rng.randint(10**4, 10**7):,}</td><td>{rng.uniform(0.1, 20):.2f}倍</td></tr></tbody></table>
+<div class="kabuka_trend"><table><tr><th>5日</th><th>25日</th><th>75日</th></tr><tr><td>{rng.uniform(-10, 10):+.1f}%</td><td>{rng.uniform(-10, 10):+.1f}%</td><td>{rng.uniform(-10, 10):+.1f}%</td></tr></table></div>
+</div>
+<aside>{_noise(rng, noise - noise // 2)}</aside>
+</body></html>"""
+
+
+def news_page(code: str, noise: int, items: int, rng: random.Random) -> str:
+    rows = "\n".join(
+        f'<tr><td class="date">25/10/{28 - i % 28:02d} {rng.randint(8, 17):02d}:{rng.randint(0, 59):02d}</td>'
+        f'<td class="ctg">材料</td><td><a href="/news/marketnews/?b=n{rng.randint(10**8, 10**9)}">{code} ニュース見出し {i}</a></td></tr>'
+        for i in range(items)
+    )
+    return f"""<html><body>
+<header>{_noise(rng, noise // 2)}</header>
+<table class="s_news_list">
+{rows}
+</table>
+<aside>{_noise(rng, noise - noise // 2)}</aside>
+</body></html>"""
+
+
+def history_page(code: str, noise: int, bars: int, rng: random.Random) -> str:
+    price = rng.uniform(300, 30000)
+    rows = []
+    for i in range(bars):
+        o = price
+        c = price * (1 + rng.uniform(-0.03, 0.03))
+        h, l = max(o, c) * 1.01, min(o, c) * 0.99
+        day = 28 - i % 28
+        month = 10 - (i // 28) % 12
+        rows.append(
+            f'<tr><th><time datetime="2025-{month:02d}-{day:02d}">25/{month:02d}/{day:02d}</time></th>'
+            f'<td>{_yen(o)}</td><td>{_yen(h)}</td><td>{_yen(l)}</td><td>{_yen(c)}</td>'
+            f'<td>{c - o:+,.0f}</td><td>{(c / o - 1) * 100:+.2f}</td><td>{rng.randint(10**4, 10**8):,}</td></tr>'
+        )
+        price = c
+    return f"""<html><body>
+<header>{_noise(rng, noise // 2)}</header>
+<table class="stock_kabuka0"><tbody>
+{rows[0]}
+</tbody></table>
+<table class="stock_kabuka_dwm"><tbody>
+{"".join(rows[1:])}
+</tbody></table>
+<aside>{_noise(rng, noise - noise // 2)}</aside>
+</body></html>"""
+
+
+def synthetic(kind: str, code: str, size: str) -> bytes:
+    spec = SIZES[size]
+    rng = random.Random(f"{kind}:{code}:{size}")
+    if kind == "details":
+        html = detail_page(code, spec["noise"], rng)
+    elif kind == "news":
+        html = news_page(code, spec["noise"], spec["news"], rng)
+    else:
+        html = history_page(code, spec["noise"], spec["bars"], rng)
+    return html.encode("utf-8")
+
+
+def recorded() -> Dict[str, List[Tuple[str, bytes]]]:
+    """保存済みの実ページを kind ごとに (code, body) のリストで返す"""
+    pages: Dict[str, List[Tuple[str, bytes]]] = {kind: [] for kind in KINDS}
+    for kind in KINDS:
+        directory = os.path.join(FIXTURE_DIR, kind)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".html"):
+                with open(os.path.join(directory, name), "rb") as f:
+                    pages[kind].append((name[:-5], f.read()))
+    return pages
+
+
+def groups(tickers: List[str], sizes: List[str]) -> Iterator[Tuple[str, str, List[Tuple[str, bytes]]]]:
+    """(グループ名, kind, [(code, body)]) を返す。実ページは "recorded" グループ"""
+    for kind, pages in recorded().items():
+        if pages:
+            yield "recorded", kind, pages
+    for size in sizes:
+        for kind in KINDS:
+            yield size, kind, [(code, synthetic(kind, code, size)) for code in tickers]
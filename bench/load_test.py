@@ -0,0 +1,139 @@
+"""FastAPI /stocks/{code} ・ Flask /stock/<code> への負荷試験
+
+同時接続数を段階的に上げながら一定時間リクエストし続け、段ごとに
+レイテンシ (p50/p95/p99)、スループット、エラー数、1 リクエストあたりの上流アクセス数 (fan-out) を出す。
+fan-out は bench/stub_upstream.py の /__stats の差分から求める。
+
+    python bench/stub_upstream.py --latency 80 --jitter 40 &
+    TRADEINFO_KABUTAN_BASE_URL=http://127.0.0.1:8765 uvicorn main:app --port 8000   # backend/ で実行
+    python bench/load_test.py --target fastapi --concurrency 1,8,32,64 --duration 10
+
+    KABUTAN_BASE_URL=http://127.0.0.1:8765 python app.py
+    python bench/load_test.py --target flask --codes 5
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+TARGETS = {
+    "fastapi": ("http://127.0.0.1:8000", "/stocks/{code}"),
+    "flask": ("http://127.0.0.1:5001", "/stock/{code}"),
+}
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def stub_counts(client: httpx.AsyncClient, stub_url: str) -> Optional[Dict[str, int]]:
+    try:
+        response = await client.get(f"{stub_url}/__stats")
+        return response.json()
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+async def run_stage(url_template: str, codes: List[str], concurrency: int, duration: float,
+                    stub_url: str, timeout: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    next_code = itertools.cycle(codes)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        before = await stub_counts(client, stub_url)
+        deadline = time.monotonic() + duration
+
+        async def worker():
+            while time.monotonic() < deadline:
+                url = url_template.format(code=next(next_code))
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+        after = await stub_counts(client, stub_url)
+
+    latencies.sort()
+    total = len(latencies)
+    result = {
+        "concurrency": concurrency,
+        "requests": total,
+        "rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "errors": total - statuses.get("200", 0),
+        "statuses": statuses,
+        "upstream": None,
+        "fanout": None,
+    }
+    if before is not None and after is not None:
+        # errors はスタブが返したエラー応答の数 (上流アクセス数には含めない)
+        upstream = sum(v - before.get(k, 0) for k, v in after.items() if k != "errors")
+        result["upstream"] = upstream
+        result["fanout"] = round(upstream / total, 3) if total else 0.0
+    return result
+
+
+async def main_async(args) -> List[dict]:
+    base_url, path = TARGETS[args.target]
+    url_template = (args.base_url or base_url).rstrip("/") + (args.path or path)
+    codes = [str(7000 + i) for i in range(args.codes)]
+
+    if args.reset_stub:
+        async with httpx.AsyncClient() as client:
+            try:
+                await client.post(f"{args.stub}/__reset")
+            except httpx.HTTPError:
+                pass
+
+    print(f"{args.target}: {url_template} codes={len(codes)} duration={args.duration}s/stage")
+    print(f"{'conc':>5s} {'reqs':>7s} {'rps':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'errors':>7s} {'fan-out':>8s}")
+    results = []
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        r = await run_stage(url_template, codes, concurrency, args.duration, args.stub, args.timeout)
+        fanout = "-" if r["fanout"] is None else f"{r['fanout']:.3f}"
+        print(f"{r['concurrency']:5d} {r['requests']:7d} {r['rps']:8.1f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} "
+              f"{r['p99_ms']:8.1f} {r['errors']:7d} {fanout:>8s}")
+        results.append(r)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=list(TARGETS), default="fastapi")
+    parser.add_argument("--base-url", help="バックエンドの URL (既定: fastapi=:8000, flask=:5001)")
+    parser.add_argument("--path", help="パスのテンプレート (既定: /stocks/{code} または /stock/{code})")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="段ごとの同時接続数")
+    parser.add_argument("--duration", type=float, default=10.0, help="1 段あたりの秒数")
+    parser.add_argument("--codes", type=int, default=20, help="巡回する銘柄数 (少ないほどキャッシュが効く)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--stub", default="http://127.0.0.1:8765", help="スタブ上流の URL (fan-out 計測用)")
+    parser.add_argument("--reset-stub", action="store_true", help="開始前にスタブのカウンターを 0 に戻す")
+    parser.add_argument("--json", help="結果を JSON で書き出すパス")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"target": args.target, "stages": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
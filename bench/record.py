@@ -0,0 +1,45 @@
+"""株探の実ページを bench/fixtures/<kind>/<code>.html に保存する
+
+    python bench/record.py 7203 6758 9984
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import FIXTURE_DIR, KINDS, PATHS  # noqa: E402
+
+BASE_URL = os.environ.get("KABUTAN_BASE_URL", "https://kabutan.jp")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("codes", nargs="+")
+    parser.add_argument("--kinds", default=",".join(KINDS))
+    parser.add_argument("--interval", type=float, default=1.0, help="リクエスト間隔 (秒)")
+    args = parser.parse_args()
+
+    session = requests.Session()
+    session.headers["User-Agent"] = "Mozilla/5.0"
+    for code in args.codes:
+        for kind in args.kinds.split(","):
+            url = f"{BASE_URL}{PATHS[kind]}?code={code}"
+            response = session.get(url, timeout=10)
+            if response.status_code != 200:
+                print(f"skip {url}: HTTP {response.status_code}", file=sys.stderr)
+                continue
+            directory = os.path.join(FIXTURE_DIR, kind)
+            os.makedirs(directory, exist_ok=True)
+            # 取得したバイト列をそのまま保存する (エンコーディング判定もベンチ対象に含める)
+            with open(os.path.join(directory, f"{code}.html"), "wb") as f:
+                f.write(response.content)
+            print(f"{kind:8s} {code} {len(response.content):>8,d} bytes")
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
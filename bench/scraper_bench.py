@@ -0,0 +1,271 @@
+"""株探スクレイピングのオフラインベンチマーク
+
+保存済み / 合成の株探ページを KabutanService (FastAPI) と Flask の
+get_stock_details / get_kabutan_news に通し、ページ種別ごとに
+処理時間 (中央値・p95)、tracemalloc によるピークメモリ・残存メモリを出す。
+
+    python bench/scraper_bench.py                     # 計測して表示 (baseline.json があれば比較)
+    python bench/scraper_bench.py --save-baseline     # 結果を baseline.json に保存
+    python bench/scraper_bench.py --parser html.parser --targets service
+    python bench/scraper_bench.py --check-scope       # 詳細ページの絞り込みで抽出結果が変わらないか確認
+
+比較時は中央値・ピークメモリが --threshold を超えて悪化した項目があれば終了コード 1 を返す。
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "bench")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+sys.path.insert(0, BENCH_DIR)
+
+import fixtures  # noqa: E402
+
+KIND_BY_PATH = {path: kind for kind, path in fixtures.PATHS.items()}
+
+
+def _configure(parser: str) -> None:
+    # 計測中はローカル蓄積・ワーカープロセスを使わず、パースをその場で行う
+    os.environ.setdefault("TRADEINFO_HISTORY_STORE_PATH", "")
+    os.environ.setdefault("TRADEINFO_PARSE_EXECUTOR", "inline")
+    os.environ.setdefault("OHLCV_STORE_PATH", "")
+    if parser:
+        os.environ["TRADEINFO_HTML_PARSER"] = parser
+        os.environ["KABUTAN_HTML_PARSER"] = parser
+
+
+class _Pages:
+    """URL (パス + code) → フィクスチャのバイト列"""
+
+    def __init__(self):
+        self.pages: Dict[Tuple[str, str], bytes] = {}
+
+    def load(self, kind: str, pages: List[Tuple[str, bytes]]) -> None:
+        for code, body in pages:
+            self.pages[(kind, code)] = body
+
+    def body(self, url: str) -> bytes:
+        parts = urlsplit(url)
+        kind = KIND_BY_PATH[parts.path]
+        return self.pages[(kind, parse_qs(parts.query)["code"][0])]
+
+
+# ---------------------------------------------------------
+# 計測対象
+# ---------------------------------------------------------
+def service_target(pages: _Pages) -> Dict[str, Callable[[str], object]]:
+    sys.path.insert(0, os.path.join(ROOT, "backend"))
+    import httpx
+    from services.kabutan import KabutanService
+
+    class FixtureClient:
+        async def get(self, url: str, kind: str = "other") -> httpx.Response:
+            return httpx.Response(
+                200, content=pages.body(url), headers={"Content-Type": "text/html; charset=utf-8"},
+                request=httpx.Request("GET", url))
+
+    service = KabutanService(client=FixtureClient())
+    loop = asyncio.new_event_loop()
+
+    def call(coro_fn):
+        def run(code):
+            service.cache.clear()
+            return loop.run_until_complete(coro_fn(code))
+        return run
+
+    return {
+        "details": call(lambda code: service.get_stock_details(code, parts={"quote"})),
+        "news": call(service.get_news),
+        "history": call(service.get_history_columns),
+    }
+
+
+def flask_target(pages: _Pages) -> Dict[str, Callable[[str], object]]:
+    sys.path.insert(0, ROOT)
+    import requests
+    import app
+
+    def fetch_upstream(url, kind="other"):
+        response = requests.models.Response()
+        response.status_code = 200
+        response._content = pages.body(url)
+        response.encoding = "utf-8"
+        response.url = url
+        return response
+
+    app.fetch_upstream = fetch_upstream
+
+    def call(fn):
+        def run(code):
+            app.scrape_cache.clear()
+            return fn(code)
+        return run
+
+    return {"details": call(app.get_stock_details), "news": call(app.get_kabutan_news)}
+
+
+TARGETS = {"service": service_target, "flask": flask_target}
+
+
+def check_scope(args) -> List[str]:
+    """詳細ページを銘柄情報のブロックに絞って解析した結果が、ページ全体を解析した結果と一致するか確かめる
+
+    一致しなかったページ ("グループ/code") を返す。
+    """
+    sys.path.insert(0, os.path.join(ROOT, "backend"))
+    from services import kabutan_parser, parsing
+
+    def full_tree(html, parser=None):
+        return parsing.make_soup(html, None, parser)
+
+    parser = parsing.resolve_parser(args.parser or None)
+    mismatches = []
+    for group, kind, group_pages in fixtures.groups(fixtures.DEFAULT_TICKERS[: args.tickers], args.sizes.split(",")):
+        if kind != "details":
+            continue
+        for code, body in group_pages:
+            html = body.decode("utf-8", errors="replace")
+            scoped = kabutan_parser.parse_details(html, parser)
+            kabutan_parser.make_detail_soup = full_tree
+            try:
+                full = kabutan_parser.parse_details(html, parser)
+            finally:
+                kabutan_parser.make_detail_soup = parsing.make_detail_soup
+            if scoped != full:
+                mismatches.append(f"{group}/{code}")
+    return mismatches
+
+
+# ---------------------------------------------------------
+# 計測
+# ---------------------------------------------------------
+def measure(run: Callable[[str], object], codes: List[str], repeat: int) -> dict:
+    for code in codes:   # ウォームアップ (import・正規表現のコンパイル等を除く)
+        run(code)
+
+    times = []
+    for _ in range(repeat):
+        for code in codes:
+            started = time.perf_counter()
+            run(code)
+            times.append(time.perf_counter() - started)
+
+    peaks, retained = [], []
+    tracemalloc.start()
+    for code in codes:
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = run(code)
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+        retained.append(current - before)
+        del result
+    tracemalloc.stop()
+
+    times.sort()
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 3),
+        "peak_kb": round(statistics.median(peaks) / 1024, 1),
+        "retained_kb": round(statistics.median(retained) / 1024, 1),
+    }
+
+
+def run_all(args) -> Dict[str, dict]:
+    pages = _Pages()
+    cases = list(fixtures.groups(fixtures.DEFAULT_TICKERS[: args.tickers], args.sizes.split(",")))
+    for _, kind, group_pages in cases:
+        pages.load(kind, group_pages)
+
+    results = {}
+    for target in args.targets.split(","):
+        runners = TARGETS[target](pages)
+        for group, kind, group_pages in cases:
+            if kind not in runners:
+                continue
+            codes = [code for code, _ in group_pages]
+            # 同じ code がグループ間で重なるので、計測前にこのグループのページを入れ直す
+            pages.load(kind, group_pages)
+            stats = measure(runners[kind], codes, args.repeat)
+            stats["pages"] = len(codes)
+            stats["avg_bytes"] = sum(len(body) for _, body in group_pages) // len(codes)
+            results[f"{target}/{group}/{kind}"] = stats
+    return results
+
+
+def report(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    regressions = []
+    header = f"{'case':32s} {'pages':>5s} {'bytes':>9s} {'median ms':>10s} {'p95 ms':>9s} {'peak KB':>9s} {'kept KB':>8s}"
+    if baseline:
+        header += f" {'Δmedian':>8s} {'Δpeak':>8s}"
+    print(header)
+    for case, s in results.items():
+        line = (f"{case:32s} {s['pages']:5d} {s['avg_bytes']:9,d} {s['median_ms']:10.3f} "
+                f"{s['p95_ms']:9.3f} {s['peak_kb']:9.1f} {s['retained_kb']:8.1f}")
+        base = baseline.get(case)
+        if base:
+            deltas = []
+            for key in ("median_ms", "peak_kb"):
+                change = s[key] / base[key] - 1 if base[key] else 0.0
+                deltas.append(f"{change:+8.1%}")
+                if change > threshold:
+                    regressions.append(f"{case} {key}: {base[key]} -> {s[key]} ({change:+.1%})")
+            line += " " + " ".join(deltas)
+        print(line)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", default="service,flask")
+    parser.add_argument("--sizes", default=",".join(fixtures.SIZES))
+    parser.add_argument("--tickers", type=int, default=len(fixtures.DEFAULT_TICKERS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--parser", default="", help="HTML パーサー (lxml / html.parser)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="悪化と見なす割合 (0.2 = 20%%)")
+    parser.add_argument("--json", help="結果を JSON で書き出すパス")
+    parser.add_argument("--check-scope", action="store_true", help="詳細ページの絞り込みの前後で抽出結果を比較する")
+    args = parser.parse_args()
+
+    _configure(args.parser)
+    if args.check_scope:
+        mismatches = check_scope(args)
+        print(f"detail scope: {len(mismatches)} mismatches")
+        for case in mismatches:
+            print("  " + case)
+        sys.exit(1 if mismatches else 0)
+    results = run_all(args)
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, args.threshold)
+
+    for path in ([args.baseline] if args.save_baseline else []) + ([args.json] if args.json else []):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"saved {path}")
+
+    if regressions:
+        print("\nregressions:")
+        for line in regressions:
+            print("  " + line)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
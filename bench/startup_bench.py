@@ -0,0 +1,187 @@
+"""起動時間 (コールドスタート) のベンチマーク
+
+app.py / app_v2.py / backend/main.py を毎回新しいプロセスで起動し、
+モジュールの import 時間と、import 開始から最初の応答が返るまでの時間、
+プロセス起動から終了までの時間を計測して中央値・最大値を出す。
+応答はテストクライアント (Flask の test_client / FastAPI の TestClient) で取り、ネットワークは使わない。
+
+    python bench/startup_bench.py                          # 計測して表示 (startup_baseline.json があれば比較)
+    python bench/startup_bench.py --save-baseline          # 結果を startup_baseline.json に保存
+    python bench/startup_bench.py --targets app --importtime 15   # import の遅いパッケージ上位 15 件も出す
+    python bench/startup_bench.py --env PRELOAD_YFINANCE=1 --env WARM_TEMPLATES=1
+
+比較時は import 時間・最初の応答までの時間の中央値が --threshold を超えて悪化した項目があれば終了コード 1 を返す。
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "bench")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "startup_baseline.json")
+
+# target → (作業ディレクトリ, モジュール, 種別, 最初に取るパス)
+TARGETS = {
+    "app": (ROOT, "app", "flask", "/favorites/watchlist"),
+    "app_v2": (ROOT, "app_v2", "flask", "/favorites/watchlist"),
+    "main": (os.path.join(ROOT, "backend"), "main", "fastapi", "/health"),
+}
+
+# 子プロセスで実行する計測コード (結果を 1 行の JSON で出す)
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module} as target
+imported = time.perf_counter()
+if "{kind}" == "flask":
+    status = target.app.test_client().get("{path}").status_code
+    responded = time.perf_counter()
+else:
+    from fastapi.testclient import TestClient
+    with TestClient(target.app) as client:
+        status = client.get("{path}").status_code
+        responded = time.perf_counter()
+print(json.dumps({{"import_s": imported - started, "first_response_s": responded - started,
+                  "status": status, "modules": len(sys.modules)}}))
+"""
+
+# 計測中はローカル蓄積・バックグラウンド更新・ワーカープロセスを使わない
+_QUIET_ENV = {
+    "OHLCV_STORE_PATH": "",
+    "TRADEINFO_HISTORY_STORE_PATH": "",
+    "TRADEINFO_PARSE_EXECUTOR": "inline",
+    "TRADEINFO_REFRESH_ENABLED": "false",
+}
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+\d+ \|\s*(\S+)")
+
+
+def _command(target: str, importtime: bool = False) -> List[str]:
+    _, module, kind, path = TARGETS[target]
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    return command + ["-c", _PROBE.format(module=module, kind=kind, path=path)]
+
+
+def _environ(extra: Dict[str, str]) -> Dict[str, str]:
+    env = dict(os.environ)
+    for key, value in _QUIET_ENV.items():
+        env.setdefault(key, value)
+    env.update(extra)
+    # 各回を同じ条件にするため .pyc は使うが、書き出しはしない
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def run_once(target: str, env: Dict[str, str]) -> dict:
+    cwd = TARGETS[target][0]
+    started = time.perf_counter()
+    proc = subprocess.run(_command(target), cwd=cwd, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"{target} failed:\n{proc.stderr.strip()}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["process_s"] = elapsed
+    return result
+
+
+def measure(target: str, runs: int, env: Dict[str, str]) -> dict:
+    samples = [run_once(target, env) for _ in range(runs)]
+    stats = {"status": samples[-1]["status"], "modules": samples[-1]["modules"]}
+    for key in ("import_s", "first_response_s", "process_s"):
+        values = [s[key] for s in samples]
+        name = key[:-2]
+        stats[f"{name}_ms"] = round(statistics.median(values) * 1000, 1)
+        stats[f"{name}_max_ms"] = round(max(values) * 1000, 1)
+    return stats
+
+
+def slowest_imports(target: str, env: Dict[str, str], top: int) -> List[tuple]:
+    """-X importtime の出力を、パッケージ (最上位の名前) ごとの自身の import 時間の合計で大きい順に返す"""
+    proc = subprocess.run(_command(target, importtime=True), cwd=TARGETS[target][0], env=env,
+                          capture_output=True, text=True)
+    totals: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if m:
+            # 累積時間は入れ子で重複するので、各モジュール自身の時間を足し上げる
+            package = m.group(2).split(".")[0]
+            totals[package] = totals.get(package, 0) + int(m.group(1))
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def report(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    regressions = []
+    header = (f"{'target':8s} {'status':>6s} {'modules':>7s} {'import ms':>10s} {'max':>8s} "
+              f"{'first resp ms':>14s} {'max':>8s} {'process ms':>11s} {'max':>8s}")
+    if baseline:
+        header += f" {'Δimport':>8s} {'Δfirst':>8s}"
+    print(header)
+    for target, s in results.items():
+        line = (f"{target:8s} {s['status']:6d} {s['modules']:7d} {s['import_ms']:10.1f} {s['import_max_ms']:8.1f} "
+                f"{s['first_response_ms']:14.1f} {s['first_response_max_ms']:8.1f} "
+                f"{s['process_ms']:11.1f} {s['process_max_ms']:8.1f}")
+        base = baseline.get(target)
+        if base:
+            deltas = []
+            for key in ("import_ms", "first_response_ms"):
+                change = s[key] / base[key] - 1 if base[key] else 0.0
+                deltas.append(f"{change:+8.1%}")
+                if change > threshold:
+                    regressions.append(f"{target} {key}: {base[key]} -> {s[key]} ({change:+.1%})")
+            line += " " + " ".join(deltas)
+        print(line)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="計測対象に渡す環境変数 (複数指定可)")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N",
+                        help="import の遅いパッケージ上位 N 件を表示する")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="悪化と見なす割合 (0.2 = 20%%)")
+    parser.add_argument("--json", help="結果を JSON で書き出すパス")
+    args = parser.parse_args()
+
+    env = _environ(dict(item.split("=", 1) for item in args.env))
+    targets = args.targets.split(",")
+    results = {target: measure(target, args.runs, env) for target in targets}
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, args.threshold)
+
+    if args.importtime:
+        for target in targets:
+            print(f"\n{target}: slowest imports (self ms by package)")
+            for name, us in slowest_imports(target, env, args.importtime):
+                print(f"  {name:40s} {us / 1000:8.1f}")
+
+    for path in ([args.baseline] if args.save_baseline else []) + ([args.json] if args.json else []):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"saved {path}")
+
+    if regressions:
+        print("\nregressions:")
+        for line in regressions:
+            print("  " + line)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
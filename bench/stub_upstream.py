@@ -0,0 +1,130 @@
+"""負荷試験用の株探スタンドイン (ローカル HTTP サーバー)
+
+/stock/ ・ /stock/news ・ /stock/kabuka を任意の code で返す。
+bench/fixtures/ に保存済みのページがあればそれを、無ければ合成ページを返す。
+応答ごとに遅延 (--latency ± --jitter ミリ秒) を入れ、--error-rate の割合で --error-status を返す。
+
+    python bench/stub_upstream.py --port 8765 --latency 80 --jitter 40 --error-rate 0.02
+
+バックエンド側は次の環境変数でスタブに向ける:
+    FastAPI: TRADEINFO_KABUTAN_BASE_URL=http://127.0.0.1:8765
+    Flask:   KABUTAN_BASE_URL=http://127.0.0.1:8765
+
+GET /__stats で受けたリクエスト数 (パス別) を JSON で返し、POST /__reset で 0 に戻す。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures  # noqa: E402
+
+KIND_BY_PATH = {path: kind for kind, path in fixtures.PATHS.items()}
+
+
+class StubState:
+    def __init__(self, size: str, latency: float, jitter: float, error_rate: float, error_status: int, seed: int):
+        self.size = size
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.recorded = {(kind, code): body for kind, pages in fixtures.recorded().items() for code, body in pages}
+        self.pages = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def page(self, kind: str, code: str) -> bytes:
+        key = (kind, code)
+        body = self.recorded.get(key) or self.pages.get(key)
+        if body is None:
+            body = self.pages[key] = fixtures.synthetic(kind, code, self.size)
+        return body
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def draw(self):
+        """(遅延秒, エラーにするか)"""
+        with self.lock:
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            return delay, self.rng.random() < self.error_rate
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            if parts.path == "/__stats":
+                with state.lock:
+                    counts = dict(state.counts)
+                return self._send(200, json.dumps(counts).encode(), "application/json")
+            kind = KIND_BY_PATH.get(parts.path)
+            code = parse_qs(parts.query).get("code", [""])[0]
+            if kind is None or not code:
+                return self._send(404, b"")
+
+            state.count(parts.path)
+            delay, fail = state.draw()
+            time.sleep(delay)
+            if fail:
+                state.count("errors")
+                return self._send(state.error_status, b"error")
+            self._send(200, state.page(kind, code), "text/html; charset=utf-8")
+
+        def do_POST(self):
+            if urlsplit(self.path).path != "/__reset":
+                return self._send(404, b"")
+            with state.lock:
+                state.counts.clear()
+            self._send(204, b"")
+
+        def _send(self, status: int, body: bytes, content_type: str = "text/plain") -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--size", choices=list(fixtures.SIZES), default="medium", help="合成ページの大きさ")
+    parser.add_argument("--latency", type=float, default=50.0, help="応答遅延の平均 (ミリ秒)")
+    parser.add_argument("--jitter", type=float, default=20.0, help="遅延の揺らぎ幅 (± ミリ秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラー応答の割合 (0-1)")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    state = StubState(args.size, args.latency, args.jitter, args.error_rate, args.error_status, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"stub kabutan on http://{args.host}:{args.port} (size={args.size}, latency={args.latency}±{args.jitter}ms, "
+          f"error_rate={args.error_rate})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
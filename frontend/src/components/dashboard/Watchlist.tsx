@@ -24,15 +24,41 @@ export default function Watchlist() {
   const watchlistCodes = watchlist.map(i => i.code).join(',');
 
   // Fetch missing metadata for active category items
+  // 1 リクエストでまとめて取得し、NDJSON を届いた行から順に反映する
   useEffect(() => {
-    watchlist.forEach(async (item) => {
-      if (!item.code) return;
-      if (!item.name || !item.price) {
-        try {
-          const resp = await fetch(`http://127.0.0.1:8000/stocks/${item.code}`);
-          if (resp.ok) {
-            const data = await resp.json();
-            updateWatchlistItem(item.code, {
+    const missing = watchlist
+      .filter(item => item.code && (!item.name || !item.price))
+      .map(item => item.code);
+    if (missing.length === 0) return;
+
+    const controller = new AbortController();
+    (async () => {
+      try {
+        const resp = await fetch(`http://127.0.0.1:8000/stocks/batch`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({
+            codes: missing,
+            fields: ["name", "current_price", "change", "change_percent", "vwap"]
+          }),
+          signal: controller.signal
+        });
+        if (!resp.ok || !resp.body) return;
+
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split("\n");
+          buffer = lines.pop() ?? "";
+          for (const line of lines) {
+            if (!line.trim()) continue;
+            const data = JSON.parse(line);
+            if (data.error) continue;
+            updateWatchlistItem(data.code, {
               name: data.name,
               price: data.current_price,
               change: `${data.change} (${data.change_percent}%)`,
@@ -40,13 +66,29 @@ export default function Watchlist() {
               vwap: data.vwap
             });
           }
-        } catch (e) {
-          console.error(`Failed to fetch metadata for ${item.code}`, e);
+        }
+      } catch (e) {
+        if (!controller.signal.aborted) {
+          console.error("Failed to fetch watchlist metadata", e);
         }
       }
-    });
+    })();
+    return () => controller.abort();
   }, [watchlistCodes, updateWatchlistItem]);
 
+  // 全カテゴリの銘柄をバックエンドに登録する (取引時間中の定期更新・寄り付き前の先読みの対象)
+  const allCodes = Array.from(new Set(categories.flatMap(c => c.items.map(i => i.code)))).join(',');
+  useEffect(() => {
+    const timer = setTimeout(() => {
+      fetch(`http://127.0.0.1:8000/stocks/watchlist`, {
+        method: "PUT",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ codes: allCodes ? allCodes.split(',') : [], client: "dashboard" })
+      }).catch(e => console.error("Failed to sync watchlist", e));
+    }, 1000);
+    return () => clearTimeout(timer);
+  }, [allCodes]);
+
   const handleBulkAdd = () => {
     const tickers = input
       .split(/[\s,、\n]+/)